@@ -0,0 +1,140 @@
+# Classify Dart Throwers (Python version of classify_dart_throwers_stacking.R)
+
+# Notes about this model:
+# Same workflow as the R script - grid search a KNN model and an SVM with 5-fold stratified cross validation, then stack
+# their out-of-fold predictions with a logistic regression model. The SVM and logistic regression grid searches use
+# mlpb.cv.grid_search, which runs every (parameter set, fold) pair in parallel on a process pool that shares the training
+# data through shared memory. The KNN grid search uses mlpb.knn.knn_grid_search, which builds one KD-tree per fold and
+# gets the predictions for every k = 1..30 from a single 30-nearest-neighbor query.
+# LiblineaR's SVM "types" are expressed as LinearSVC (penalty, loss, dual) combinations, and its logistic regression types
+# as LogisticRegression l1_ratio (0 = L2, 1 = L1) with the saga solver.
+#
+# Worker processes started with spawn or forkserver (the default on Windows and macOS, and on Linux from Python 3.14)
+# import this script, so everything after the settings runs only under if __name__ == "__main__".
+
+# Imports
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import LinearSVC
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.colstore import read_table
+from mlpb.profiling import Profiler
+from mlpb.cv import grid_search, stratified_folds
+from mlpb.knn import MultiKNN, knn_grid_search
+
+# # Set working directory
+# os.chdir("/Path/To/Classify Dart Throwers")
+
+# Number of worker processes for the grid searches (None = one per CPU)
+n_jobs = None
+
+if __name__ == "__main__":
+
+    # Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+    profiler = Profiler.from_env("classify_dart_throwers_stacking")
+
+    #======================================================================================================
+    # Load the data (Assumes your working directory is the "Classify Dart Throwers" directory)
+
+    profiler.mark("Load the data")
+    train = read_table("_Data/train.csv")
+    test = read_table("_Data/test.csv")
+
+    #--------------------------------------------------
+    # Add feature DistFromCenter
+
+    train['DistFromCenter'] = np.sqrt(train.XCoord**2 + train.YCoord**2)
+    test['DistFromCenter'] = np.sqrt(test.XCoord**2 + test.YCoord**2)
+
+    #--------------------------------------------------
+    # Build folds for cross validation and stacking
+
+    train['FoldID'] = stratified_folds(train.Competitor, nfolds=5, seed=2016)
+
+    #======================================================================================================
+    # KNN
+    #
+    # Do a grid search for k = 1, 2, ... 30 by cross validating model using folds 1-5
+    # I.e. [test=f1, train=(f2, f3, f4, f5)], [test=f2, train=(f1, f3, f4, f5)], ...
+
+    profiler.mark("KNN", rows=train.shape[0])
+    knnFeatures = ['XCoord', 'YCoord']
+    knnCV = knn_grid_search(X=train[knnFeatures].values, y=train.Competitor.values, folds=train.FoldID.values, ks=range(1, 31))
+
+    # Check the best parameters
+    knnCV.best_params
+
+    # Score for each k value
+    knnCV.scores
+
+    #======================================================================================================
+    # SVM
+    #
+    # Do a grid search over LiblineaR types 1, 2, 3, 5 and cost = .01 ... 2000 by cross validating model using folds 1-5
+
+    profiler.mark("SVM", rows=train.shape[0])
+    costs = [.01, .1, 1, 10, 100, 1000, 2000]
+    svmFeatures = ['XCoord', 'YCoord', 'DistFromCenter']
+    svmGrid = [
+        {'penalty': ['l2'], 'loss': ['squared_hinge'], 'dual': [True, False], 'C': costs, 'max_iter': [10000]},  # types 1, 2
+        {'penalty': ['l2'], 'loss': ['hinge'], 'dual': [True], 'C': costs, 'max_iter': [10000]},  # type 3
+        {'penalty': ['l1'], 'loss': ['squared_hinge'], 'dual': [False], 'C': costs, 'max_iter': [10000]}  # type 5
+    ]
+    svmCV = grid_search(LinearSVC, svmGrid, X=train[svmFeatures].values, y=train.Competitor.values, folds=train.FoldID.values, n_jobs=n_jobs)
+
+    # Check the best parameters
+    svmCV.best_params
+
+    # Score for each parameter set
+    svmCV.scores
+
+    #======================================================================================================
+    # Ensemble KNN, SVM using Logistic Regression
+
+    profiler.mark("Ensemble KNN, SVM using Logistic Regression", rows=train.shape[0])
+
+    # Insert the out-of-fold predictions into train and one-hot encode them
+    train['Meta_knn'] = pd.Categorical(knnCV.best_oof, categories=knnCV.classes)
+    train['Meta_svm'] = pd.Categorical(svmCV.best_oof, categories=svmCV.classes)
+    trainMetas = pd.get_dummies(train[['Meta_knn', 'Meta_svm']], dtype=np.float64)
+
+    #--------------------------------------------------
+    # Cross Validation
+
+    lrFeatures = ['XCoord', 'YCoord', 'DistFromCenter'] + trainMetas.columns.tolist()
+    lrGrid = {'solver': ['saga'], 'l1_ratio': [0, 1], 'C': [.001, .01, .1, 1, 10, 100], 'max_iter': [10000]}
+    trainLR = pd.concat([train[['XCoord', 'YCoord', 'DistFromCenter']], trainMetas], axis=1)
+    lrCV = grid_search(LogisticRegression, lrGrid, X=trainLR.values, y=train.Competitor.values, folds=train.FoldID.values, n_jobs=n_jobs)
+
+    knnCV.best_params
+    svmCV.best_params
+    lrCV.best_params
+
+    #======================================================================================================
+    # Make predictions on the holdout set
+
+    profiler.mark("Make predictions on the holdout set", rows=test.shape[0])
+
+    # knn
+    knn = MultiKNN(max_k=knnCV.best_params['n_neighbors']).fit(train[knnFeatures].values, train.Competitor.values)
+    test['Meta_knn'] = pd.Categorical(knn.predict(test[knnFeatures].values), categories=knnCV.classes)
+
+    # svm
+    svm = LinearSVC(**svmCV.best_params).fit(train[svmFeatures].values, train.Competitor.values)
+    test['Meta_svm'] = pd.Categorical(svm.predict(test[svmFeatures].values), categories=svmCV.classes)
+
+    # ensemble
+    testLR = pd.concat([test[['XCoord', 'YCoord', 'DistFromCenter']], pd.get_dummies(test[['Meta_knn', 'Meta_svm']], dtype=np.float64)], axis=1)
+    logreg = LogisticRegression(**lrCV.best_params).fit(trainLR.values, train.Competitor.values)
+    test['Pred_ensemble'] = logreg.predict(testLR[lrFeatures].values)
+
+    # Results
+    np.mean(test.Competitor == test.Meta_knn)
+    np.mean(test.Competitor == test.Meta_svm)
+    np.mean(test.Competitor == test.Pred_ensemble)
+
+    profiler.finish()
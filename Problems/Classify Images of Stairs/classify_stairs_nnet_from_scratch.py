@@ -0,0 +1,71 @@
+# Classify Images of Stairs with a neural network built from scratch (Python version of
+# classify_stairs_nnet_from_scratch.R)
+
+# Notes about this model:
+# Same network as the R script - input layer with 4 nodes (R1C1, R1C2, R2C1, R2C2), hidden layer with 2 nodes, output
+# layer with 2 nodes, sigmoid activation on the hidden layer, softmax on the output layer, categorical cross entropy
+# error. The network itself lives in nnet.py, which reuses preallocated buffers so it also scales to millions of images.
+
+# Imports
+import os
+import sys
+import numpy as np
+import pandas as pd
+from nnet import MLP, make_stairs
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.colstore import read_table
+from mlpb.profiling import Profiler
+
+# # Set working directory
+# os.chdir("/Path/To/Classify Images of Stairs")
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("classify_stairs_nnet_from_scratch")
+
+#======================================================================================================
+# Load Data (Assumes your current working directory is the Classify Images of Stairs problem directory)
+
+profiler.mark("Load Data")
+train = read_table("_Data/train.csv")
+test = read_table("_Data/test.csv")
+
+pixels = ['R1C1', 'R1C2', 'R2C1', 'R2C2']
+
+#======================================================================================================
+# NNet from scratch
+
+profiler.mark("NNet from scratch", rows=train.shape[0])
+
+#--------------------------------------------------
+# Weight initialization (uniform on [-0.01, 0.01])
+
+nnet = MLP([4, 2, 2], seed=1)
+
+#--------------------------------------------------
+# Train with full batch gradient descent, stepsize 0.1, 1500 epochs
+
+history = nnet.fit(train[pixels].values, train.IsStairs.values, epochs=1500, batch_size=None, learning_rate=0.1,
+                   verbose_every=100)
+
+#--------------------------------------------------
+# Make predictions on the test data
+
+test['ProbStairs'] = nnet.predict_proba(test[pixels].values)[:, 1]
+print("accuracy on test data:", np.mean(nnet.predict(test[pixels].values) == test.IsStairs))  # 0.86
+
+#======================================================================================================
+# Throughput on a large synthetic dataset
+#
+# make_stairs() generates images like _Data/data_generation.R. Scale the intensities to [0, 1] and use mini-batches;
+# samples/sec is reported every epoch. Try size=4 (16 pixels, layer sizes [16, ...]) for larger images
+
+profiler.mark("Throughput on a large synthetic dataset", rows=10**6)
+X, y = make_stairs(10**6, size=2, seed=2017, dtype=np.float32)
+X /= 255
+
+bignet = MLP([4, 8, 2], seed=1, dtype=np.float32)
+history = bignet.fit(X, y, epochs=5, batch_size=1024, learning_rate=0.5, seed=2017, verbose_every=1)
+pd.DataFrame(history)
+
+profiler.finish()
@@ -0,0 +1,236 @@
+# Neural network from scratch with NumPy
+
+# Notes about this module:
+# MLP is the network from classify_stairs_nnet_from_scratch.R (sigmoid hidden layers, softmax output, categorical cross
+# entropy, gradient descent) written so it can train on millions of images:
+# - forward and backward passes are batched matrix products
+# - activation, delta and gradient buffers are allocated once per batch size and reused every batch and epoch, and every
+#   step writes into them with out= arguments, so the inner loop doesn't allocate
+# - softmax subtracts each row's max before exponentiating (the "offset trick"), so it can't overflow
+# - batch_size sets the mini-batch size (None = full batch gradient descent, like the R script)
+#
+# Usage (assumes your current working directory is the Classify Images of Stairs problem directory):
+#   X, y = make_stairs(10**6, size=2, seed=2017)
+#   net = MLP([4, 2, 2], seed=1)
+#   history = net.fit(X, y, epochs=10, batch_size=1024, learning_rate=0.1)
+#   history[-1]  # {'epoch': 10, 'loss': ..., 'accuracy': ..., 'samples_per_sec': ...}
+
+import time
+import numpy as np
+from scipy.special import expit
+
+#======================================================================================================
+# Helper methods
+
+
+def sigmoid(x, out=None):
+    """Sigmoid function (numerically stable; out may be x to compute it in place)."""
+    return expit(x, out=out)
+
+
+def softmax(m, out=None, work=None):
+    """
+    Row-wise softmax using the offset trick (out may be m to compute it in place)
+
+    work: optional (rows, 1) buffer for the row maxes and sums
+    """
+    if out is None:
+        out = np.empty_like(m)
+    if work is None:
+        work = np.empty((m.shape[0], 1), dtype=m.dtype)
+    np.max(m, axis=1, keepdims=True, out=work)
+    np.subtract(m, work, out=out)
+    np.exp(out, out=out)
+    np.sum(out, axis=1, keepdims=True, out=work)
+    out /= work
+    return out
+
+
+def make_stairs(n, size=2, seed=None, dtype=np.float32):
+    """
+    Random size x size grayscale images, half of them stairs (like _Data/data_generation.R for size=2)
+
+    Stairs have the pixels on and below a staircase (going up to the left or to the right) dark (150-255) and the rest
+    light (0-10). Non stairs have every pixel uniform on 0-255. Returns X with one row per image (pixels in row major
+    order, i.e. R1C1, R1C2, R2C1, R2C2 for size=2) and y with 1 for stairs, 0 otherwise.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = np.indices((size, size))
+    patterns = np.stack([(cols <= rows).ravel(), (cols >= size - 1 - rows).ravel()])
+
+    y = np.zeros(n, dtype=np.int64)
+    y[:n // 2] = 1
+    rng.shuffle(y)
+
+    X = rng.integers(0, 256, size=(n, size * size)).astype(dtype)
+    stairs = np.flatnonzero(y)
+    dark = patterns[rng.integers(0, 2, size=len(stairs))]
+    X[stairs] = np.where(dark, rng.integers(150, 256, size=dark.shape), rng.integers(0, 11, size=dark.shape))
+    return X, y
+
+#======================================================================================================
+# Model
+
+
+class MLP(object):
+    """
+    Multilayer perceptron classifier
+
+    layer_sizes: nodes per layer, input layer first and output layer (one node per class) last, e.g. [4, 2, 2]
+    init_range: weights and biases start uniform on [-init_range, init_range]
+    """
+
+    def __init__(self, layer_sizes, seed=None, init_range=0.01, dtype=np.float64):
+        self.layer_sizes = list(layer_sizes)
+        self.dtype = dtype
+        rng = np.random.default_rng(seed)
+        pairs = list(zip(self.layer_sizes[:-1], self.layer_sizes[1:]))
+        self.W = [rng.uniform(-init_range, init_range, size=(a, b)).astype(dtype) for a, b in pairs]
+        self.b = [rng.uniform(-init_range, init_range, size=b).astype(dtype) for a, b in pairs]
+        self._buffer_rows = 0
+
+    #--------------------------------------------------
+    # Buffers
+
+    def _allocate(self, rows):
+        # Activations A[0] (input) ... A[L] (output), deltas D[1] ... D[L] (D[0] unused) and gradients, for up to `rows`
+        # samples per batch. Smaller batches use the first rows of each buffer
+        if rows <= self._buffer_rows:
+            return
+        self.A = [np.empty((rows, size), dtype=self.dtype) for size in self.layer_sizes]
+        self.D = [np.empty((rows, size), dtype=self.dtype) for size in self.layer_sizes]
+        self.gW = [np.empty_like(W) for W in self.W]
+        self.gb = [np.empty_like(b) for b in self.b]
+        self._idx = np.empty(rows, dtype=np.int64)
+        self._y = np.empty(rows, dtype=np.int64)
+        self._flat = np.empty(rows, dtype=np.int64)
+        self._offsets = np.arange(rows, dtype=np.int64) * self.layer_sizes[-1]
+        self._p = np.empty(rows, dtype=self.dtype)
+        self._logp = np.empty(rows, dtype=self.dtype)
+        self._pred = np.empty(rows, dtype=np.int64)
+        self._hit = np.empty(rows, dtype=bool)
+        self._work = np.empty((rows, 1), dtype=self.dtype)
+        self._buffer_rows = rows
+
+    #--------------------------------------------------
+    # Forward and backward passes
+
+    def _forward(self, m):
+        # Propagate the m samples in A[0][:m] through the network. Returns the softmax output A[L][:m]
+        L = len(self.W)
+        for l in range(L):
+            Z = self.A[l + 1][:m]
+            np.matmul(self.A[l][:m], self.W[l], out=Z)
+            Z += self.b[l]
+            if l < L - 1:
+                sigmoid(Z, out=Z)
+            else:
+                softmax(Z, out=Z, work=self._work[:m])
+        return self.A[L][:m]
+
+    def _backward(self, m, y, learning_rate):
+        # Given the output of _forward and class labels y (length m), update the weights by one gradient step.
+        # Returns the total cross entropy of the batch
+        L = len(self.W)
+        Yhat = self.A[L][:m]
+
+        # Probability assigned to the true class of each sample, and the batch's cross entropy
+        flat = np.add(self._offsets[:m], y, out=self._flat[:m])
+        p = np.take(Yhat, flat, out=self._p[:m])
+        logp = np.maximum(p, np.finfo(self.dtype).tiny, out=self._logp[:m])
+        loss = -np.log(logp, out=logp).sum()
+
+        # Partial CE/Partial Z at the output layer is Yhat - Y
+        delta = self.D[L][:m]
+        delta[...] = Yhat
+        p -= 1
+        np.put(delta, flat, p)
+
+        for l in range(L - 1, -1, -1):
+            # Gradients of the mean cross entropy
+            np.matmul(self.A[l][:m].T, self.D[l + 1][:m], out=self.gW[l])
+            self.gW[l] *= learning_rate / m
+            np.sum(self.D[l + 1][:m], axis=0, out=self.gb[l])
+            self.gb[l] *= learning_rate / m
+
+            # Partial CE/Partial Z for the previous (sigmoid) layer: (delta %*% t(W)) * X * (1 - X)
+            if l > 0:
+                X = self.A[l][:m]
+                prev = self.D[l][:m]
+                np.matmul(self.D[l + 1][:m], self.W[l].T, out=prev)
+                prev *= X
+                np.subtract(1, X, out=X)  # the activations aren't needed after this
+                prev *= X
+
+            # Weight updates
+            self.W[l] -= self.gW[l]
+            self.b[l] -= self.gb[l]
+
+        return loss
+
+    #--------------------------------------------------
+    # Training and prediction
+
+    def fit(self, X, y, epochs=1, batch_size=None, learning_rate=0.1, shuffle=True, seed=None, verbose_every=0):
+        """
+        Train with (mini-batch) gradient descent
+
+        X: one row per sample (converted to the network's dtype once up front, so pass that dtype to avoid a copy).
+          y: class index (0, 1, ...) per sample
+        batch_size: samples per gradient step (None = all of them)
+        verbose_every: print the epoch's loss, accuracy and throughput every this many epochs (0 = never)
+        Returns a list with one dict per epoch: epoch, loss (mean cross entropy), accuracy and samples_per_sec.
+        Loss and accuracy are measured on each batch before its weight update.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        y = np.asarray(y, dtype=np.int64)
+        n = X.shape[0]
+        batch_size = n if batch_size is None else min(batch_size, n)
+        self._allocate(batch_size)
+        order = np.arange(n)
+        rng = np.random.default_rng(seed)
+
+        history = []
+        for epoch in range(1, epochs + 1):
+            if shuffle and batch_size < n:
+                rng.shuffle(order)
+            start_time = time.perf_counter()
+            loss = 0.0
+            correct = 0
+            for start in range(0, n, batch_size):
+                m = min(batch_size, n - start)
+                idx = self._idx[:m]
+                idx[...] = order[start:start + m]
+                np.take(X, idx, axis=0, out=self.A[0][:m])
+                yb = np.take(y, idx, out=self._y[:m])
+
+                Yhat = self._forward(m)
+                pred = np.argmax(Yhat, axis=1, out=self._pred[:m])
+                correct += np.count_nonzero(np.equal(pred, yb, out=self._hit[:m]))
+                loss += self._backward(m, yb, learning_rate)
+
+            seconds = time.perf_counter() - start_time
+            history.append({'epoch': epoch, 'loss': loss / n, 'accuracy': correct / n,
+                            'samples_per_sec': n / seconds if seconds > 0 else np.inf})
+            if verbose_every and epoch % verbose_every == 0:
+                print("Epoch: {epoch} Loss: {loss:.6f} | accuracy: {accuracy:.4f} | samples/sec: {samples_per_sec:,.0f}"
+                      .format(**history[-1]))
+
+        return history
+
+    def predict_proba(self, X, batch_size=65536):
+        """Class probabilities for each row of X."""
+        X = np.asarray(X)
+        n = X.shape[0]
+        batch_size = max(1, min(batch_size, n))
+        self._allocate(batch_size)
+        probs = np.empty((n, self.layer_sizes[-1]), dtype=self.dtype)
+        for start in range(0, n, batch_size):
+            m = min(batch_size, n - start)
+            self.A[0][:m] = X[start:start + m]
+            probs[start:start + m] = self._forward(m)
+        return probs
+
+    def predict(self, X, batch_size=65536):
+        """Most likely class index for each row of X."""
+        return self.predict_proba(X, batch_size=batch_size).argmax(axis=1)
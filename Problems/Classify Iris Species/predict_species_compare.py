@@ -0,0 +1,102 @@
+# Iris example (Python): compare XGBoost, random forests, logistic regression and naive Bayes
+# Predicting Species from Sepal.Length, Sepal.Width, Petal.Length and Petal.Width
+
+# Notes about this model:
+# predict_species_xgb.R trains one xgboost model. Here the data is loaded and the feature matrices built once, and
+# mlpb.compare.compare_models trains every candidate model on them concurrently in worker processes that share the
+# matrices, reporting test accuracy, log loss and fit/predict throughput side by side. The xgboost model uses the same
+# parameters as the R script (multi:softprob, max_depth 2, eta 1, 10 rounds); its predict_proba returns a
+# (samples x classes) matrix, so no unpacking of the flat probability vector is needed.
+# Note that the R script scores the training data (it reads train.csv twice); this script scores test.csv.
+# The script body is guarded by if __name__ == "__main__", because compare_models' workers import this module when they
+# are started with spawn or forkserver (Windows, macOS, and Linux from Python 3.14).
+
+# Imports
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+from xgboost import XGBClassifier
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.compare import compare_models
+from mlpb.profiling import Profiler
+from mlpb.schema import IRIS
+
+# # Set working directory
+# os.chdir("/Path/To/Classify Iris Species")
+
+# Number of worker processes for the comparison (None = one per CPU, up to the number of models)
+n_jobs = None
+
+if __name__ == "__main__":
+
+    # Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+    profiler = Profiler.from_env("predict_species_compare")
+
+    #======================================================================================================
+    # Load data (Assumes your current working directory is the Classify Iris Species problem directory)
+
+    profiler.mark("Load data")
+    train = IRIS.read("_Data/train.csv")
+    test = IRIS.read("_Data/test.csv")
+
+    #--------------------------------------------------
+    # Overall distribution of Species
+
+    train.Species.value_counts(normalize=True)
+
+    #======================================================================================================
+    # Build the feature matrices (once, for every model)
+
+    profiler.mark("Build the feature matrices", rows=train.shape[0] + test.shape[0])
+    features = ['Sepal.Length', 'Sepal.Width', 'Petal.Length', 'Petal.Width']
+    train_X = train[features].to_numpy(dtype=np.float64)
+    test_X = test[features].to_numpy(dtype=np.float64)
+
+    #======================================================================================================
+    # Compare models
+
+    profiler.mark("Compare models", rows=train.shape[0])
+
+    # Each model runs in its own worker, so the multi-threaded ones get a single thread
+    configs = [
+        ('xgb', XGBClassifier, {'objective': 'multi:softprob', 'max_depth': 2, 'learning_rate': 1, 'n_estimators': 10, 'n_jobs': 1}),
+        ('rf', RandomForestClassifier, {'n_estimators': 101, 'random_state': 2016, 'n_jobs': 1}),
+        ('rf_max_features_1', RandomForestClassifier, {'n_estimators': 101, 'max_features': 1, 'random_state': 2016, 'n_jobs': 1}),
+        ('logreg', LogisticRegression, {'max_iter': 1000}),
+        ('nb', GaussianNB, {})
+    ]
+    results = compare_models(configs, train_X, train.Species.to_numpy(), test_X, test.Species.to_numpy(), n_jobs=n_jobs)
+
+    # Accuracy, log loss and fit/predict throughput of every model
+    results.scores
+    results.best
+
+    #======================================================================================================
+    # Predictions of the xgboost model
+
+    profiler.mark("Predictions of the xgboost model", rows=test.shape[0])
+
+    #--------------------------------------------------
+    # Predicted probabilities and the most likely species
+
+    preds = pd.DataFrame(results.probs['xgb'], columns=results.classes)
+    preds['Prediction'] = results.classes[preds[results.classes].to_numpy().argmax(axis=1)]
+
+    #--------------------------------------------------
+    # Compare predictions to true results
+
+    pd.concat([test.reset_index(drop=True), preds], axis=1)
+
+    #--------------------------------------------------
+    # Feature importance (refit on the main process, since the workers' models aren't sent back)
+
+    classes, train_y = np.unique(train.Species.to_numpy(), return_inverse=True)
+    bst = XGBClassifier(**configs[0][2]).fit(train_X, train_y)
+    pd.Series(bst.feature_importances_, index=features).sort_values(ascending=False)
+
+    profiler.finish()
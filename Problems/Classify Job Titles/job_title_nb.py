@@ -0,0 +1,76 @@
+# Streaming Naive Bayes for job titles
+
+# Notes about this module:
+# naive_bayes_model.py fits a CountVectorizer vocabulary over the whole corpus and densifies the word counts before
+# fitting BernoulliNB, which doesn't scale to tens of millions of titles. Here:
+# - HashingVectorizer maps each word to one of n_features columns, so there is no vocabulary to build or store and any
+#   batch can be vectorized independently
+# - the word matrix stays a scipy sparse matrix end to end (BernoulliNB and MultinomialNB both accept sparse input)
+# - job_category is mapped to 0, 1, 2 with a vectorized Categorical lookup
+# - the model is trained with partial_fit, one batch at a time, so it can be updated with each day's new titles
+# MultinomialNB is the default. BernoulliNB also scores every absent word, i.e. every empty hashed column, so with a wide
+# hash space it is swamped by the empty columns; only use it with n_features close to the real vocabulary size.
+#
+# Usage (assumes your current working directory is the Classify Job Titles problem directory):
+#   vectorizer, model = make_vectorizer(), make_model()
+#   update_model(vectorizer, model, read_batches("_Data/jobtitles.csv", batch_size=100000))
+#   update_model(vectorizer, model, read_batches("todays_titles.csv"))  # later, without refitting
+#   model.predict_proba(vectorizer.transform(["junior data analyst"]))
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import BernoulliNB, MultinomialNB
+
+# Convert the categories finance, sales, and technology to numbers 0, 1, and 2
+CATEGORIES = ['finance', 'sales', 'technology']
+
+#======================================================================================================
+# Features and labels
+
+
+def make_vectorizer(n_features=2**20, binary=False):
+    """
+    Hashing vectorizer for job titles
+
+    binary: True gives 0/1 word indicators (for BernoulliNB), False gives word counts (for MultinomialNB)
+    """
+    # alternate_sign=False and norm=None keep the values non-negative counts, as Naive Bayes requires
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None, binary=binary)
+
+
+def encode_labels(job_category):
+    """job_category as 0, 1, 2 (the position in CATEGORIES)."""
+    codes = pd.Categorical(job_category, categories=CATEGORIES).codes
+    if (codes < 0).any():
+        raise ValueError("Unknown or missing job_category; expected one of {}".format(CATEGORIES))
+    return codes
+
+#======================================================================================================
+# Model
+
+
+def make_model(kind='multinomial', alpha=1.0):
+    """Unfitted BernoulliNB or MultinomialNB. BernoulliNB binarizes its input, so it works with word counts too."""
+    if kind == 'bernoulli':
+        return BernoulliNB(alpha=alpha, binarize=0.0)  # any count > 0 is a present word, whatever the vectorizer gives
+    if kind == 'multinomial':
+        return MultinomialNB(alpha=alpha)
+    raise ValueError("kind must be 'bernoulli' or 'multinomial'")
+
+
+def read_batches(path, batch_size=100000):
+    """Iterate over labelled job titles in a csv in DataFrame batches (titles without a category are skipped)."""
+    for batch in pd.read_csv(path, usecols=['job_title', 'job_category'], dtype=str, chunksize=batch_size):
+        batch = batch[batch.job_category.notnull()]
+        if batch.shape[0] > 0:
+            yield batch
+
+
+def update_model(vectorizer, model, batches):
+    """Train (or keep training) model on batches of job titles with partial_fit. Returns the model."""
+    classes = np.arange(len(CATEGORIES))
+    for batch in batches:
+        X = vectorizer.transform(batch.job_title.values)
+        model.partial_fit(X, encode_labels(batch.job_category), classes=classes)
+    return model
@@ -0,0 +1,59 @@
+# Naive Bayes with feature hashing, trained in batches
+
+# Notes about this model:
+# Same idea as naive_bayes_model.py, but built to scale: job titles are vectorized with a fixed width HashingVectorizer
+# instead of a fitted vocabulary, everything stays sparse, and the model is trained with partial_fit over batches so it
+# can be updated with new titles without a full refit. See job_title_nb.py
+
+# Imports
+import os
+import sys
+import numpy as np
+import pandas as pd
+from job_title_nb import CATEGORIES, make_model, make_vectorizer, read_batches, update_model
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.colstore import read_table
+from mlpb.profiling import Profiler
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("naive_bayes_hashing_model")
+
+#======================================================================================================
+# Load Data (Assumes your current working directory is the Classify Job Titles problem directory)
+
+profiler.mark("Load Data")
+job_titles = read_table("_Data/jobtitles.csv")
+
+#======================================================================================================
+# Train the model in batches
+
+profiler.mark("Train the model in batches")
+
+# The vectorizer needs no fitting. Each title becomes a sparse row with the count of each of its words in the word's
+# hashed column
+vectorizer = make_vectorizer(n_features=2**20)
+
+# Train on the labelled titles in batches of $MLPB_BATCH_SIZE titles. The default of 4 illustrates batching on the demo
+# file; use something like 100000 for real data
+batch_size = int(os.environ.get('MLPB_BATCH_SIZE', 4))
+naive_bayes = make_model('multinomial', alpha=1)
+update_model(vectorizer, naive_bayes, read_batches("_Data/jobtitles.csv", batch_size=batch_size))
+
+#======================================================================================================
+# Classify the new titles
+
+profiler.mark("Classify the new titles", rows=2)
+X_new = vectorizer.transform(job_titles.job_title[10:12])
+X_new  # sparse, never densified
+
+pd.DataFrame(naive_bayes.predict_proba(X_new), columns=CATEGORIES, index=job_titles.job_title[10:12])
+
+#--------------------------------------------------
+# Later, update the model with another batch of labelled titles (no refit from scratch)
+
+new_batch = pd.DataFrame({'job_title': ["data scientist", "sales associate"], 'job_category': ["technology", "sales"]})
+update_model(vectorizer, naive_bayes, [new_batch])
+pd.DataFrame(naive_bayes.predict_proba(X_new), columns=CATEGORIES, index=job_titles.job_title[10:12])
+
+profiler.finish()
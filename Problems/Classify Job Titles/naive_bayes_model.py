@@ -1,10 +1,21 @@
+import os
+import sys
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.naive_bayes import BernoulliNB
 import pandas as pd
 
+sys.path.append(os.path.join("..", ".."))
+from mlpb.profiling import Profiler
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("naive_bayes_model")
+
 # Load the data (Assumes your current working directory is the Classify Job Titles problem directory)
+profiler.mark("Load the data")
 job_titles = pd.read_csv("_Data/jobtitles.csv")
 
+profiler.mark("Vectorize", rows=10)
+
 # Convert the categories Technology, Sales, and Finance to numbers 0, 1, and 2
 y = list(map(lambda x: {'finance':0, 'sales':1, 'technology':2}[x], job_titles.job_category[:10]))
 
@@ -15,14 +26,16 @@ count_vectorizer.fit(job_titles.job_title)
 X = count_vectorizer.transform(job_titles.job_title[:10])
 
 # Dump results into a pandas DataFrame since this is a small example for illustrative purposes
-df = pd.DataFrame(X.toarray(), columns=count_vectorizer.get_feature_names())
+df = pd.DataFrame(X.toarray(), columns=count_vectorizer.get_feature_names_out())
 df
 
 # Now consider a new title
 X_new = count_vectorizer.transform(job_titles.job_title[10:12])
-df_new = pd.DataFrame(X_new.toarray(), columns=count_vectorizer.get_feature_names())
+df_new = pd.DataFrame(X_new.toarray(), columns=count_vectorizer.get_feature_names_out())
 df_new
 
+profiler.mark("Naive Bayes", rows=10)
+
 # Check our results with scikit-learn's Bernoulli Naive Bayes classifier
 naive_bayes = BernoulliNB(alpha=0.000000001)  # make alpha virtually 0
 naive_bayes.fit(X=df, y=y)
@@ -32,3 +45,5 @@ naive_bayes.predict_proba(X=df_new)
 naive_bayes = BernoulliNB(alpha=1)  # make alpha 1
 naive_bayes.fit(X=df, y=y)
 naive_bayes.predict_proba(X=df_new)
+
+profiler.finish()
@@ -0,0 +1,215 @@
+# Shrunken (empirical Bayes) target means over the City < Region < Country hierarchy
+
+# Notes about this module:
+# predict_income_xgb1.R uses the raw average income per City, Region and Country as features, which is noisy for cities
+# with a handful of people, and predict_income_xgb2.R one-hot-encodes every ID, which takes a column per city.
+# HierarchicalTargetEncoder replaces both with three columns: each group's mean income shrunk towards its parent's
+# (shrunken) mean, the country's towards the overall mean. A group with n people and income total s gets
+#   (s + k * parent_mean) / (n + k)
+# where k = (within group variance) / (variance of the group means around their parents) is estimated per level from the
+# data (method of moments), or fixed with smoothing=. Unseen cities fall back to their region's mean and so on.
+# - Only counts, sums and sums of squares per group are kept. They are computed for all three levels with one lexsort of
+#   the rows and np.add.reduceat over each level's group boundaries
+# - fit_transform_oof() encodes each training row with statistics that exclude its fold (like transformTrain() in
+#   predict_income_xgb1.R), by subtracting the fold's statistics from the full ones instead of refitting per fold
+# - update() folds new income rows into the statistics without revisiting the old ones
+#
+# Usage (assumes your current working directory is the Predict Income problem directory):
+#   encoder = HierarchicalTargetEncoder()
+#   train_X = encoder.fit_transform_oof(train, train.Income, folds=5, seed=2016)
+#   test_X = encoder.transform(test)
+#   encoder.update(new_rows, new_rows.Income)  # then transform() uses the new statistics
+
+import numpy as np
+import pandas as pd
+
+# ID columns from the top of the hierarchy to the bottom
+LEVELS = ['CountryID', 'RegionID', 'CityID']
+
+#======================================================================================================
+# Group statistics
+#
+# The statistics of one level are a DataFrame indexed by the level's IDs with columns Parent (ID of the group at the
+# level above, absent at the top level), N, Sum and SumSq
+
+
+def group_stats(data, y, levels=LEVELS):
+    """Count, sum and sum of squares of y per group at every level (list of DataFrames, top level first)."""
+    keys = [np.asarray(data[level]) for level in levels]
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n == 0:
+        return [pd.DataFrame({'N': np.zeros(0, dtype=np.int64), 'Sum': np.zeros(0), 'SumSq': np.zeros(0)})
+                .rename_axis(level) for level in levels]
+
+    # Sort by country, then region, then city. The groups of every level are then contiguous runs of rows, and the runs
+    # of a level are the runs of the level above split wherever the ID changes
+    order = np.lexsort(keys[::-1])
+    y_sorted = y[order]
+    y_squared = y_sorted**2
+    new_group = np.zeros(n, dtype=bool)
+    new_group[0] = True
+
+    stats = []
+    parent_starts = None
+    for level, k in zip(levels, keys):
+        k = k[order]
+        new_group[1:] |= k[1:] != k[:-1]
+        starts = np.flatnonzero(new_group)
+        ids = k[starts]
+        if len(pd.unique(ids)) != len(ids):
+            raise ValueError("Some {} belongs to more than one {}".format(level, levels[len(stats) - 1]))
+        s = pd.DataFrame({
+            'N': np.diff(np.append(starts, n)),
+            'Sum': np.add.reduceat(y_sorted, starts),
+            'SumSq': np.add.reduceat(y_squared, starts)
+        }, index=pd.Index(ids, name=level))
+        if parent_starts is not None:
+            s.insert(0, 'Parent', stats[-1].index.values[np.searchsorted(parent_starts, starts, side='right') - 1])
+        stats.append(s)
+        parent_starts = starts
+    return stats
+
+
+def combine_stats(a, b, sign=1):
+    """Statistics of the rows behind a plus (sign=1) or minus (sign=-1) the rows behind b."""
+    combined = []
+    for sa, sb in zip(a, b):
+        s = sa.reindex(sa.index.union(sb.index))
+        if 'Parent' in s:
+            s['Parent'] = s.Parent.fillna(sb.Parent)
+        for col in ['N', 'Sum', 'SumSq']:
+            s[col] = s[col].fillna(0).add(sign * sb[col], fill_value=0)
+        s['N'] = s.N.astype(np.int64)
+        combined.append(s)
+    return combined
+
+#======================================================================================================
+# Encoder
+
+
+class HierarchicalTargetEncoder(object):
+    """
+    Empirical Bayes target encoder for nested categorical IDs
+
+    levels: ID columns, top of the hierarchy first
+    smoothing: prior weight k (in rows) of a group's parent mean. None = estimated per level from the data
+    """
+
+    def __init__(self, levels=LEVELS, smoothing=None, dtype=np.float64):
+        self.levels = list(levels)
+        self.smoothing = smoothing
+        self.dtype = dtype
+
+    def feature_names(self, counts=False):
+        names = [level.replace('ID', 'Enc') for level in self.levels]
+        if counts:
+            names += [level.replace('ID', 'N') for level in self.levels]
+        return names
+
+    #--------------------------------------------------
+    # Fitting
+
+    def fit(self, data, y):
+        self.stats_ = group_stats(data, y, self.levels)
+        self._estimate()
+        return self
+
+    def update(self, data, y):
+        """Add the incomes of new rows (possibly of new cities, regions or countries) to the fitted statistics."""
+        self.stats_ = combine_stats(self.stats_, group_stats(data, y, self.levels))
+        self._estimate()
+        return self
+
+    def _estimate(self):
+        self.global_mean_, self.smoothing_, self.means_ = shrunken_means(self.stats_, self.smoothing)
+
+    #--------------------------------------------------
+    # Encoding
+
+    def transform(self, data, counts=False):
+        """(rows x levels) array of shrunken means, followed by each group's training row count if counts=True."""
+        return self._encode(data, self.stats_, self.global_mean_, self.means_, counts)
+
+    def _encode(self, data, stats, global_mean, means, counts, out=None, rows=slice(None)):
+        n = data.shape[0]
+        L = len(self.levels)
+        if out is None:
+            out = np.empty((n, 2 * L if counts else L), dtype=self.dtype)
+        fallback = np.full(n, global_mean)
+        for l, level in enumerate(self.levels):
+            idx = stats[l].index.get_indexer(data[level])
+            seen = idx >= 0
+            fallback = np.where(seen, means[l][idx], fallback)  # unseen groups take their parent's value
+            out[rows, l] = fallback
+            if counts:
+                out[rows, L + l] = np.where(seen, stats[l].N.values[idx], 0)
+        return out
+
+    def fit_transform_oof(self, data, y, folds=5, seed=None, counts=False):
+        """
+        Fit on all the rows, then encode each row with the statistics of the rows outside its fold
+
+        folds: fold ID per row, or a number of random folds of (nearly) equal size
+        """
+        n = data.shape[0]
+        if np.isscalar(folds):
+            folds = np.random.default_rng(seed).permutation(n) % folds
+        folds = np.asarray(folds)
+        y = np.asarray(y, dtype=np.float64)
+        self.fit(data, y)
+
+        out = np.empty((n, 2 * len(self.levels) if counts else len(self.levels)), dtype=self.dtype)
+        for fold in np.unique(folds):
+            rows = np.flatnonzero(folds == fold)
+            fold_data = data.iloc[rows]
+            stats = combine_stats(self.stats_, group_stats(fold_data, y[rows], self.levels), sign=-1)
+            global_mean, _, means = shrunken_means(stats, self.smoothing)
+            self._encode(fold_data, stats, global_mean, means, counts, out=out, rows=rows)
+        return out
+
+
+def shrunken_means(stats, smoothing=None):
+    """
+    Overall mean, prior weight k per level and shrunken mean per group (aligned with stats) for statistics from
+    group_stats()
+
+    Groups with no rows (e.g. after subtracting a fold) get their parent's mean.
+    """
+    top = stats[0]
+    total_n = top.N.sum()
+    global_mean = top.Sum.sum() / total_n if total_n > 0 else 0.0
+
+    ks, means = [], []
+    parent_means = parent_raw = None
+    for l, s in enumerate(stats):
+        n, total = s.N.values, s.Sum.values
+        if l == 0:
+            prior = np.full(len(s), global_mean)
+            prior_raw = prior
+        else:
+            parent = stats[l - 1].index.get_indexer(s.Parent)
+            prior, prior_raw = parent_means[parent], parent_raw[parent]
+        has_rows = n > 0
+        raw = np.divide(total, n, out=prior_raw.copy(), where=has_rows)
+
+        if smoothing is not None:
+            k = smoothing
+        else:
+            # Method of moments: within group variance from the sums of squares, variance of the group means around
+            # their parents' means from the spread of the raw means minus the part explained by sampling noise
+            within_df = n.sum() - has_rows.sum()
+            within = (s.SumSq.values - total * raw).sum() / within_df if within_df > 0 else 0.0
+            noise = within / n[has_rows]
+            between = np.mean((raw[has_rows] - prior_raw[has_rows])**2 - noise) if has_rows.any() else 0.0
+            k = within / between if between > 0 else np.inf
+
+        if np.isinf(k):
+            shrunk = prior
+        else:
+            shrunk = (total + k * prior) / (n + k) if k > 0 else np.where(has_rows, raw, prior)
+        ks.append(k)
+        means.append(shrunk)
+        parent_means, parent_raw = shrunk, raw
+
+    return global_mean, ks, means
@@ -0,0 +1,97 @@
+# Income example
+# Predicting Income per person using City, Region, Country
+# The objective of this model will be to minimize Root Mean Square Error
+
+# This model encodes CityID, RegionID and CountryID as shrunken (empirical Bayes) average incomes - each group's average
+# pulled towards its parent's, more so the fewer people it has (see hierarchical_encoding.py). Those three columns, plus
+# the number of training people in each group (counts=True, so the model can tell well-measured averages from shrunk
+# ones), are the six features of an xgboost regression model. Like predict_income_xgb1.R, the training rows are encoded
+# out-of-fold so a person's own income never leaks into their features
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from hierarchical_encoding import HierarchicalTargetEncoder
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.colstore import read_table
+from mlpb.profiling import Profiler
+
+#======================================================================================================
+# Helper Functions
+
+
+def rmse(preds, actuals):
+    """Root Mean Squared Error"""
+    return np.sqrt(np.mean((preds - actuals)**2))
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("predict_income_xgb3")
+
+#======================================================================================================
+# Load data (Assumes your current working directory is the Predict Income problem directory)
+
+profiler.mark("Load data")
+train = read_table("_Data/train.csv")
+test = read_table("_Data/test.csv").rename(columns={'Income': 'IncomeTruth'})
+
+#======================================================================================================
+# Build modified training dataset
+
+profiler.mark("Build modified training dataset")
+folds = np.random.default_rng(2016).permutation(train.shape[0]) % 5
+encoder = HierarchicalTargetEncoder()
+train_X = encoder.fit_transform_oof(train, train.Income, folds=folds, counts=True)
+
+# Create the modified test set (encoded with statistics from all of train)
+test_X = encoder.transform(test, counts=True)
+
+# Prior weight (in people) of a group's parent average, per level
+dict(zip(encoder.levels, encoder.smoothing_))
+
+#======================================================================================================
+# xgboost that puppy
+
+profiler.mark("xgboost that puppy", rows=train.shape[0])
+features = encoder.feature_names(counts=True)
+trainM = xgb.DMatrix(train_X, label=train.Income, feature_names=features)
+testM = xgb.DMatrix(test_X, feature_names=features)
+
+#--------------------------------------------------
+# Train model
+
+paramList = {'eta': .2, 'gamma': 0, 'max_depth': 3, 'min_child_weight': 1, 'subsample': .9, 'colsample_bytree': 1, 'eval_metric': 'rmse', 'seed': 2016}  # Test various hyperparameters and values here and see what works best. (A poor man's grid search)
+cv_folds = [(np.flatnonzero(folds != f), np.flatnonzero(folds == f)) for f in range(5)]
+bst_cv = xgb.cv(params=paramList, dtrain=trainM, num_boost_round=200, folds=cv_folds, early_stopping_rounds=3)
+bst = xgb.train(params=paramList, dtrain=trainM, num_boost_round=bst_cv.shape[0])
+
+#======================================================================================================
+# Predict & Evaluate
+
+profiler.mark("Predict & Evaluate", rows=test.shape[0])
+
+#--------------------------------------------------
+# Predict
+
+train['IncomeXGB'] = bst.predict(trainM)
+test['IncomeXGB'] = bst.predict(testM)
+
+#--------------------------------------------------
+# Importance
+
+bst.get_score(importance_type='gain')
+
+#--------------------------------------------------
+# Evaluate
+
+rmse(train.IncomeXGB, train.Income)
+rmse(test.IncomeXGB, test.IncomeTruth)
+
+# Errors
+train['SE'] = (train.IncomeXGB - train.Income)**2
+test['SE'] = (test.IncomeXGB - test.IncomeTruth)**2
+test.sort_values('SE')
+
+profiler.finish()
@@ -1,21 +1,36 @@
 # Imports
+import os
+import sys
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 
+sys.path.append(os.path.join("..", ".."))
+from mlpb.inference import BlockPredictor
+from mlpb.profiling import Profiler
+from mlpb.schema import NFL
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("random_forest_model")
+
 #======================================================================================================
 # Load Data (Assumes your current working directory is the Predict NFL Game Winner problem directory)
 
-train = pd.read_csv("_Data/train.csv")
-test = pd.read_csv("_Data/test.csv")
+profiler.mark("Load Data")
+train = NFL.read("_Data/train.csv")  # compact dtypes (see mlpb/schema.py): Opponent as a category, bools, int16 OppRk
+test = NFL.read("_Data/test.csv")
 
 #======================================================================================================
 # Format the training data to the specifications for RandomForestClassifier
 
+profiler.mark("Format the training data to the specifications for RandomForestClassifier")
+
 #--------------------------------------------------
 # Convert categorical features to pandas Category type
 
-train.Opponent = pd.Categorical(train.Opponent)
-test.Opponent = pd.Categorical(test.Opponent, categories=pd.unique(pd.concat([train.Opponent, test.Opponent])))
+# Use the same categories (in the same order) for train and test so their one-hot-encoded columns line up
+opponents = pd.unique(pd.concat([train.Opponent, test.Opponent]))
+train.Opponent = pd.Categorical(train.Opponent, categories=opponents)
+test.Opponent = pd.Categorical(test.Opponent, categories=opponents)
 
 #--------------------------------------------------
 # Split the training features from the target. Use pd.get_dummies() to one-hot encode categorical values
@@ -31,6 +46,8 @@ train_y = train.SaintsWon
 #======================================================================================================
 # Build some random forest models
 
+profiler.mark("Build some random forest models", rows=train.shape[0])
+
 #--------------------------------------------------
 # Random Forest with 101 trees and the rest defaults
 
@@ -42,12 +59,15 @@ rf.fit(X=train_X, y=train_y)
 rf.estimators_[1]
 rf.estimators_[1].feature_importances_  # feature importances for train_X.columns
 
-# Make predictions on the test set
-rf.predict(test_X)  # class predictions
-rf.predict_proba(test_X)  # probabilities for rf.classes_
+# Make predictions on the test set. BlockPredictor (see mlpb/inference.py) scores blocks of rows on a thread pool, writing
+# into one preallocated array
+predictor = BlockPredictor(rf, block_size=10000)
+predictor.predict(test_X)  # class predictions
+predictor.predict_proba(test_X)  # probabilities for rf.classes_
 
-# What would the model predict for each training sample
-pd.DataFrame({'Truth': train.SaintsWon, 'Fitted': rf.predict(train_X), 'FittedProbTRUE': rf.predict_proba(train_X)[:, 1]})
+# What would the model predict for each training sample (one scoring pass gives both the classes and the probabilities)
+fitted_prob = predictor.predict_proba(train_X)
+pd.DataFrame({'Truth': train.SaintsWon, 'Fitted': rf.classes_[fitted_prob.argmax(axis=1)], 'FittedProbTRUE': fitted_prob[:, 1]})
 
 #--------------------------------------------------
 # Random Forest with 101 trees, testing 3 features at each split
@@ -58,3 +78,5 @@ rf.fit(X=train_X, y=train_y)
 
 # View the importance of each feature. See 
 rf.feature_importances_  # importances of train_X.columns
+
+profiler.finish()
@@ -0,0 +1,144 @@
+# External memory xgboost training on featurized lead blocks
+
+# Notes about this module:
+# rank_leads_xgb.py builds one in-memory DMatrix from every training lead and trains a fixed number of rounds. For a lead
+# history that doesn't fit in memory:
+# - write_lead_blocks() reads the leads csv in chunks, featurizes each chunk with a fitted LeadFeaturizer and saves it
+#   as a CSR block (.npz) in a block directory, routing a fixed fraction of the leads (by LeadID) to a held-out eval set
+# - LeadBlockIter feeds the blocks to xgboost one at a time. xgboost builds its histogram (quantile) pages from them and
+#   caches the pages on disk (ExtMemQuantileDMatrix), so training with tree_method='hist' never holds more than one
+#   block of raw data in memory
+# - train_external() trains with early stopping on the eval blocks and records the time, peak resident memory and eval
+#   metric of every boosting round
+#
+# Usage (assumes your current working directory is the Rank Sales Leads problem directory):
+#   featurizer = LeadFeaturizer().fit(train)
+#   blocks = write_lead_blocks("_Data/leads.csv", featurizer, "/tmp/lead_blocks", chunksize=100000)
+#   bst, rounds = train_external(blocks, featurizer.feature_names_, params, cache_dir="/tmp/lead_blocks")
+#   rounds  # one row per boosting round: Seconds, PeakRssMB and the eval metric
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from scipy import sparse
+from lead_scoring import read_leads
+
+from mlpb.profiling import peak_rss_mb
+
+#======================================================================================================
+# Featurized blocks on disk
+
+
+def holdout_mask(lead_ids, fraction, seed=2016):
+    """Whether each lead belongs to the eval set. Depends only on the LeadID, so it's the same for every chunking."""
+    ids = np.asarray(lead_ids, dtype=np.uint64)
+    h = (ids + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)  # Fibonacci hashing
+    return (h >> np.uint64(11)).astype(np.float64) / 2.0**53 < fraction
+
+
+def write_lead_blocks(path, featurizer, out_dir, chunksize=100000, eval_fraction=0.2, seed=2016):
+    """
+    Featurize a leads csv chunk by chunk into CSR blocks with their Sale labels
+
+    Returns a dict {'train': [block paths], 'eval': [block paths]}. Each block is a .npz holding the CSR arrays of the
+    block's model matrix and its labels.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    blocks = {'train': [], 'eval': []}
+    for i, chunk in enumerate(read_leads(path, chunksize)):
+        is_eval = holdout_mask(chunk.LeadID.values, eval_fraction, seed)
+        for name, rows in [('train', ~is_eval), ('eval', is_eval)]:
+            if not rows.any():
+                continue
+            leads = chunk[rows]
+            M = featurizer.transform_sparse(leads)
+            block_path = os.path.join(out_dir, '{}_{:05d}.npz'.format(name, i))
+            np.savez(block_path, data=M.data, indices=M.indices, indptr=M.indptr, shape=M.shape,
+                     label=leads.Sale.values.astype(np.float32))
+            blocks[name].append(block_path)
+    return blocks
+
+
+def load_block(block_path):
+    """(CSR matrix, labels) of a block written by write_lead_blocks()."""
+    with np.load(block_path) as f:
+        M = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+        return M, f['label']
+
+
+class LeadBlockIter(xgb.DataIter):
+    """Feeds featurized lead blocks to xgboost one at a time (xgboost caches its pages under cache_prefix)."""
+
+    def __init__(self, block_paths, feature_names, cache_prefix):
+        self.block_paths = list(block_paths)
+        self.feature_names = feature_names
+        self._i = 0
+        super(LeadBlockIter, self).__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._i == len(self.block_paths):
+            return False
+        M, label = load_block(self.block_paths[self._i])
+        input_data(data=M, label=label, feature_names=self.feature_names)
+        self._i += 1
+        return True
+
+    def reset(self):
+        self._i = 0
+
+#======================================================================================================
+# Training
+
+
+class RoundLog(xgb.callback.TrainingCallback):
+    """
+    Records the wall time of every boosting round, the peak resident memory so far (see mlpb.profiling.peak_rss_mb) and
+    the eval metrics xgboost reports
+    """
+
+    def __init__(self):
+        self.rounds = []
+        super(RoundLog, self).__init__()
+
+    def before_iteration(self, model, epoch, evals_log):
+        self._start = time.perf_counter()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        record = {'Round': epoch, 'Seconds': time.perf_counter() - self._start, 'PeakRssMB': peak_rss_mb()}
+        for data_name, metrics in evals_log.items():
+            for metric, values in metrics.items():
+                record['{}-{}'.format(data_name, metric)] = values[-1]
+        self.rounds.append(record)
+        return False
+
+
+def train_external(blocks, feature_names, params, cache_dir, num_boost_round=1000, early_stopping_rounds=10,
+                   max_bin=256):
+    """
+    Train an xgboost model from external memory on blocks written by write_lead_blocks()
+
+    params: booster parameters. tree_method is set to 'hist'
+    Stops once the eval metric (params['eval_metric'], e.g. 'auc') hasn't improved for early_stopping_rounds rounds.
+    Returns (booster truncated to its best round, DataFrame with one row per round).
+    """
+    if not blocks['train']:
+        raise ValueError("No training blocks")
+    params = dict(params, tree_method='hist')
+    train_iter = LeadBlockIter(blocks['train'], feature_names, os.path.join(cache_dir, 'train'))
+    dtrain = xgb.ExtMemQuantileDMatrix(train_iter, max_bin=max_bin)
+    evals = []
+    if blocks['eval']:
+        eval_iter = LeadBlockIter(blocks['eval'], feature_names, os.path.join(cache_dir, 'eval'))
+        evals.append((xgb.ExtMemQuantileDMatrix(eval_iter, max_bin=max_bin, ref=dtrain), 'eval'))
+    else:
+        early_stopping_rounds = None
+
+    log = RoundLog()
+    bst = xgb.train(params=params, dtrain=dtrain, num_boost_round=num_boost_round, evals=evals,
+                    early_stopping_rounds=early_stopping_rounds, callbacks=[log], verbose_eval=False)
+    if early_stopping_rounds is not None:
+        bst = bst[:bst.best_iteration + 1]  # xgb.train returns every round, including the ones after the best
+    return bst, pd.DataFrame(log.rounds)
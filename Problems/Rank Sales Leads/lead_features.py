@@ -0,0 +1,254 @@
+# Shared feature engineering for the Rank Sales Leads models
+
+# Notes about this module:
+# Every rank_leads_* script used to repeat the same transforms (TypeOfBusiness grouping, WebsiteExtension, AreaCode,
+# Contact) once for train and once for test, each step merging or concatenating onto the full frame. LeadFeaturizer
+# learns the category lookups once from the training data and then writes any number of lead batches straight into a
+# preallocated model matrix, so no intermediate copies of the leads table are made.
+#
+# Usage (assumes your current working directory is the Rank Sales Leads problem directory):
+#   featurizer = LeadFeaturizer().fit(train)
+#   train_X = featurizer.transform(train)
+#   test_X = featurizer.transform(test)
+#   featurizer.feature_names_  # column names of train_X and test_X
+#   test_M = featurizer.transform_sparse(test)  # same features as a scipy CSR matrix (e.g. for xgboost)
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# The repository root, for the mlpb package. The scripts in this directory import lead_features before mlpb, so they
+# get it from here
+sys.path.append(os.path.join("..", ".."))
+from mlpb.lazy import lazy_import
+from mlpb.schema import area_code_from_phone
+
+# Only transform_sparse needs scipy, so it is imported on first use
+sparse = lazy_import('scipy.sparse')
+
+# In this case, we know all the possible contact types
+CONTACTS = ["general line", "other", "manager", "owner"]  # Note the order of the elements
+
+# Website extensions that get their own column by default. Missing websites are "none", everything else is "other"
+EXTENSIONS = ['com', 'org', 'net']
+
+# Top-level domain of a website, e.g. "http://www.netcom.org/about" -> "org". Optional scheme, optional user info, then
+# the host up to the first ":", "/", "?" or "#". A trailing dot on the host is allowed
+TLD_PATTERN = r'^(?:[a-z][a-z0-9+.-]*://)?(?:[^/?#@]*@)?[^/?#:]*\.([a-z0-9-]+)\.?(?:[:/?#]|$)'
+
+# Dense (numeric) columns and one-hot-encoded blocks a featurizer can emit
+NUMERIC_BLOCKS = ['Contact', 'FacebookLikes', 'TwitterFollowers']
+CATEGORICAL_BLOCKS = ['TOB', 'AC', 'EX']
+
+#======================================================================================================
+# Column level transforms
+
+
+def type_of_business(leads):
+    """TypeOfBusiness with NaN converted to "NA_Val" (still a Categorical if it was one)."""
+    tob = leads.TypeOfBusiness
+    if isinstance(tob.dtype, pd.CategoricalDtype) and 'NA_Val' not in tob.cat.categories:
+        tob = tob.cat.add_categories('NA_Val')
+    return tob.fillna('NA_Val')
+
+
+def area_code(leads):
+    """
+    AreaCode of each lead as an integer (-1 if missing): the AreaCode column of leads read with mlpb.schema.LEADS, else
+    the first three digits of PhoneNumber
+    """
+    if 'AreaCode' in leads:
+        return leads.AreaCode.to_numpy()
+    return area_code_from_phone(leads.PhoneNumber).to_numpy()
+
+
+def website_tld(website):
+    """Lowercase top-level domain of each website (NaN if missing or unparseable)."""
+    return website.str.strip().str.lower().str.extract(TLD_PATTERN, expand=False)
+
+
+def website_extension(leads, extensions=EXTENSIONS):
+    """
+    Website extension as a Categorical with categories ["none"] + extensions + ["other"]
+
+    Websites whose top-level domain is not in extensions (including unparseable ones) are collapsed into "other".
+    Note that the extension is parsed from the host, so "netcom.org" is "org" and "shop.com.au" is "au".
+    """
+    website = leads.Website
+    idx = pd.Index(extensions).get_indexer(website_tld(website))
+    codes = np.where(idx >= 0, idx + 1, len(extensions) + 1)
+    codes[website.isnull().values] = 0
+    return pd.Categorical.from_codes(codes, categories=['none'] + list(extensions) + ['other'])
+
+
+def contact_codes(leads):
+    """Contact converted to its ordinal position in CONTACTS (-1 if unknown)."""
+    return pd.Categorical(leads.Contact, categories=CONTACTS, ordered=True).codes
+
+#======================================================================================================
+# Featurizer
+
+
+class LeadFeaturizer(object):
+    """
+    Fit-once/transform-many featurizer for sales leads
+
+    blocks: which features to emit, in order. Any of NUMERIC_BLOCKS and CATEGORICAL_BLOCKS
+    min_tob_count: business types seen fewer than this many times in the training data are grouped into "other"
+      (use 1 to keep every business type)
+    na_fill: value to insert for missing FacebookLikes and TwitterFollowers (None keeps NaN, e.g. for xgboost)
+    extensions: website extensions that get their own column (the rest are "other")
+    min_extension_count: if given, ignore extensions and instead keep every extension seen at least this many times in
+      the training data
+    """
+
+    def __init__(self, blocks=NUMERIC_BLOCKS + CATEGORICAL_BLOCKS, min_tob_count=2, na_fill=-1, extensions=EXTENSIONS,
+                 min_extension_count=None, dtype=np.float64):
+        unknown = [b for b in blocks if b not in NUMERIC_BLOCKS + CATEGORICAL_BLOCKS]
+        if unknown:
+            raise ValueError("Unknown feature blocks: {}".format(unknown))
+        self.blocks = list(blocks)
+        self.min_tob_count = min_tob_count
+        self.na_fill = na_fill
+        self.extensions = list(extensions)
+        self.min_extension_count = min_extension_count
+        self.dtype = dtype
+
+    #--------------------------------------------------
+    # Fit
+
+    def fit(self, leads):
+        """Learn the category lookups from a DataFrame of training leads."""
+
+        # TypeOfBusiness: to help avoid overfitting, and to reduce the number of columns generated from
+        # one-hot-encoding, uncommon business types are marked as "other"
+        if 'TOB' in self.blocks:
+            tob_counts = type_of_business(leads).value_counts()
+            tob_counts = tob_counts[tob_counts > 0]  # a Categorical counts its unused categories too
+            tob_counts.index = tob_counts.index.astype(str)
+            tob_counts = tob_counts.sort_index()
+            tob_groups = np.where(tob_counts.values < self.min_tob_count, 'other', tob_counts.index.values)
+            self.tob_categories_ = pd.unique(tob_groups)
+            self.tob_index_ = pd.Index(tob_counts.index)
+            self.tob_codes_ = pd.Index(self.tob_categories_).get_indexer(tob_groups)
+
+        # AreaCode: the test set could have an AreaCode not seen in the train set, in which case its row is all 0s
+        if 'AC' in self.blocks:
+            codes = area_code(leads)
+            self.ac_categories_ = np.unique(codes[codes >= 0])
+            self.ac_index_ = pd.Index(self.ac_categories_)
+
+        # WebsiteExtension: either a fixed list of extensions or the ones common enough in the training data
+        if 'EX' in self.blocks:
+            if self.min_extension_count is None:
+                self.extensions_ = self.extensions
+            else:
+                tld_counts = website_tld(leads.Website).value_counts()
+                self.extensions_ = sorted(tld_counts.index[tld_counts.values >= self.min_extension_count])
+            self.ex_categories_ = np.array(['none'] + self.extensions_ + ['other'])
+
+        # Lay out the columns of the model matrix
+        self.offsets_ = {}
+        self.feature_names_ = []
+        for block in self.blocks:
+            self.offsets_[block] = len(self.feature_names_)
+            if block in NUMERIC_BLOCKS:
+                self.feature_names_.append(block)
+            else:
+                self.feature_names_.extend(block + '_' + str(c) for c in self.categories(block))
+
+        return self
+
+    #--------------------------------------------------
+    # Transform
+
+    def categories(self, block):
+        """Category labels of a one-hot-encoded block, in column order."""
+        return getattr(self, block.lower() + '_categories_')
+
+    def category_codes(self, leads, block):
+        """Column index within `block` for each lead (-1 for categories not seen during fit)."""
+        if block == 'TOB':
+            idx = self.tob_index_.get_indexer(type_of_business(leads))
+            return np.where(idx >= 0, self.tob_codes_[idx], -1)
+        if block == 'AC':
+            return self.ac_index_.get_indexer(area_code(leads))
+        if block == 'EX':
+            return website_extension(leads, self.extensions_).codes.astype(np.int64)  # Categorical codes may be int8
+        raise ValueError("Not a categorical block: {}".format(block))
+
+    def numeric_values(self, leads, block):
+        """Values of a dense feature for each lead."""
+        if block == 'Contact':
+            return contact_codes(leads)
+        values = leads[block].to_numpy(dtype=np.float64)
+        if self.na_fill is not None:
+            values = np.where(np.isnan(values), self.na_fill, values)
+        return values
+
+    def transform(self, leads, out=None):
+        """
+        Build the (leads x features) model matrix for a batch of leads
+
+        out: optional preallocated array of shape (len(leads), len(feature_names_)) to fill and return, so that
+          repeated batches can reuse one buffer
+        """
+        n = leads.shape[0]
+        shape = (n, len(self.feature_names_))
+        if out is None:
+            out = np.zeros(shape, dtype=self.dtype)
+        elif out.shape != shape:
+            raise ValueError("out has shape {}, expected {}".format(out.shape, shape))
+        else:
+            out[:] = 0
+
+        rows = np.arange(n)
+        for block in self.blocks:
+            offset = self.offsets_[block]
+            if block in NUMERIC_BLOCKS:
+                out[:, offset] = self.numeric_values(leads, block)
+            else:
+                codes = self.category_codes(leads, block)
+                seen = codes >= 0
+                out[rows[seen], offset + codes[seen]] = 1
+
+        return out
+
+    def transform_sparse(self, leads):
+        """
+        Build the (leads x features) model matrix for a batch of leads as a CSR matrix
+
+        Every block contributes at most one entry per row (its value if numeric, a 1 in the category's column if
+        categorical), so the CSR index arrays are computed directly from the category codes in one pass instead of
+        building and stacking a sparse matrix per block. As with sparse.csr_matrix(dense), zeros are left out and NaNs
+        are stored, so xgboost still sees missing FacebookLikes and TwitterFollowers as missing.
+        """
+        n = leads.shape[0]
+        shape = (n, len(self.feature_names_))
+
+        # One slot per (lead, block). Column offsets increase with the block order, so the kept slots of each row are
+        # already sorted by column
+        cols = np.empty((n, len(self.blocks)), dtype=np.int32)
+        vals = np.ones((n, len(self.blocks)), dtype=self.dtype)
+        keep = np.empty((n, len(self.blocks)), dtype=bool)
+        for j, block in enumerate(self.blocks):
+            offset = self.offsets_[block]
+            if block in NUMERIC_BLOCKS:
+                values = self.numeric_values(leads, block)
+                cols[:, j] = offset
+                vals[:, j] = values
+                keep[:, j] = values != 0
+            else:
+                codes = self.category_codes(leads, block)
+                cols[:, j] = offset + codes
+                keep[:, j] = codes >= 0
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(keep.sum(axis=1), out=indptr[1:])
+        M = sparse.csr_matrix((vals[keep], cols[keep], indptr), shape=shape)
+        M.has_sorted_indices = True
+        return M
+
+    def fit_transform(self, leads):
+        return self.fit(leads).transform(leads)
@@ -0,0 +1,241 @@
+# Incremental feature refresh for appended leads
+
+# Notes about this module:
+# LeadFeaturizer.fit recomputes the TypeOfBusiness counts, the rare-category grouping, the AreaCode list and the column
+# layout from the whole training history, so every refresh costs time proportional to all the leads ever seen.
+# IncrementalLeadFeaturizer keeps that state between refreshes and updates it from the appended leads only:
+# - category counts: TypeOfBusiness counts (a dict, so its size grows with the number of distinct business types, not
+#   with the leads) and the set of AreaCodes seen
+# - an append-only column layout: the numeric and website extension columns come first, then every TypeOfBusiness and
+#   AreaCode column is appended when it first appears, so the columns of earlier blocks never move
+# update(new_leads) returns a LeadDelta: the CSR block of the new leads, with the features a LeadFeaturizer fitted on
+# every lead so far would give them (up to column order; see the TOB_other exception below), and a remapping of earlier
+# rows. A business type seen fewer than min_tob_count times is one-hot-encoded as "other". When new leads push its count
+# over the threshold it gets its own column, and the earlier rows that had it must move from TOB_other to that column.
+# To make that possible, the featurizer remembers the (block, row) of each rare business type's leads. Each type has
+# fewer than min_tob_count of them, so this list stays small. apply_remap() applies a delta's remapping to the stored
+# blocks (and widens them to the new layout).
+# Columns are never removed, so once every rare business type has crossed min_tob_count, TOB_other stays in the layout
+# as a column of zeros, where a LeadFeaturizer refitted on the same leads would have no TOB_other column at all.
+# The website extensions are the fixed list given to the featurizer (min_extension_count is not supported).
+#
+# Usage (assumes your current working directory is the Rank Sales Leads problem directory):
+#   refresher = IncrementalLeadFeaturizer(min_tob_count=2)
+#   blocks = [refresher.update(train).matrix]  # the history so far
+#   delta = refresher.update(todays_leads)  # cost proportional to todays_leads
+#   blocks = apply_remap(blocks, delta) + [delta.matrix]
+#   refresher.feature_names_  # column names of every block
+#   refresher.save("lead_refresh.pkl"); refresher = IncrementalLeadFeaturizer.load("lead_refresh.pkl")
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from lead_features import (CATEGORICAL_BLOCKS, EXTENSIONS, NUMERIC_BLOCKS, area_code, contact_codes, type_of_business,
+                           website_extension)
+
+from mlpb.lazy import lazy_import
+
+sparse = lazy_import('scipy.sparse')
+
+
+class LeadDelta(object):
+    """
+    Output of IncrementalLeadFeaturizer.update()
+
+    block: index of the new block (0 for the first update)
+    matrix: CSR matrix of the new leads, with one column per feature in the updated layout
+    remap: DataFrame of earlier rows whose 1 moves from one column to another (Block, Row, FromColumn, ToColumn)
+    n_features: number of columns in the updated layout
+    """
+
+    def __init__(self, block, matrix, remap, n_features):
+        self.block = block
+        self.matrix = matrix
+        self.remap = remap
+        self.n_features = n_features
+
+
+class IncrementalLeadFeaturizer(object):
+    """
+    Featurizer for sales leads whose category counts and column layout are updated from appended leads only
+
+    blocks, min_tob_count, na_fill, extensions, dtype: as for LeadFeaturizer
+    """
+
+    def __init__(self, blocks=NUMERIC_BLOCKS + CATEGORICAL_BLOCKS, min_tob_count=2, na_fill=-1, extensions=EXTENSIONS,
+                 dtype=np.float64):
+        unknown = [b for b in blocks if b not in NUMERIC_BLOCKS + CATEGORICAL_BLOCKS]
+        if unknown:
+            raise ValueError("Unknown feature blocks: {}".format(unknown))
+        self.blocks = list(blocks)
+        self.min_tob_count = min_tob_count
+        self.na_fill = na_fill
+        self.extensions = list(extensions)
+        self.dtype = dtype
+
+        self.n_blocks_ = 0
+        self.tob_counts_ = {}  # business type -> number of leads seen
+        self.rare_rows_ = {}  # business type below min_tob_count -> [(block, row), ...] of its leads
+        self.columns_ = {}  # (feature block, category or None) -> column
+        self.feature_names_ = []
+        for block in self.blocks:
+            if block in NUMERIC_BLOCKS:
+                self._add_column(block, None, block)
+        if 'EX' in self.blocks:
+            for ex in ['none'] + self.extensions + ['other']:
+                self._add_column('EX', ex, 'EX_' + ex)
+
+    def _add_column(self, block, category, name):
+        self.columns_[(block, category)] = len(self.feature_names_)
+        self.feature_names_.append(name)
+        return self.columns_[(block, category)]
+
+    def _column(self, block, category):
+        # Column of a category, appended to the layout if it's new
+        column = self.columns_.get((block, category))
+        if column is None:
+            column = self._add_column(block, category, '{}_{}'.format(block, category))
+        return column
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    #--------------------------------------------------
+    # Columns of each block
+
+    def _tob_columns(self, leads, block, remap):
+        # Column of each lead's business type. With block given, the counts are updated first (and rare rows recorded)
+        codes, uniques = pd.factorize(type_of_business(leads))
+        uniques = [str(u) for u in uniques]
+        counts = np.bincount(codes, minlength=len(uniques))
+        order = np.argsort(codes, kind='stable')  # rows grouped by business type
+        starts = np.concatenate([[0], np.cumsum(counts)])
+
+        columns = np.full(len(uniques), -1, dtype=np.int64)
+        for i, tob in enumerate(uniques):
+            before = self.tob_counts_.get(tob, 0)
+            after = before + counts[i] if block is not None else before
+            if after == 0:
+                continue  # never seen: no column, as in LeadFeaturizer
+            if after < self.min_tob_count:
+                columns[i] = self._column('TOB', 'other') if block is not None else self.columns_[('TOB', 'other')]
+                if block is not None:
+                    rows = order[starts[i]:starts[i + 1]]
+                    self.rare_rows_.setdefault(tob, []).extend((block, int(r)) for r in rows)
+            else:
+                if block is not None and ('TOB', tob) not in self.columns_:
+                    column = self._column('TOB', tob)
+                    remap.extend((b, r, self.columns_[('TOB', 'other')], column) for b, r in self.rare_rows_.pop(tob, []))
+                columns[i] = self.columns_[('TOB', tob)]
+            if block is not None:
+                self.tob_counts_[tob] = after
+        return columns[codes]
+
+    def _ac_columns(self, leads, update):
+        codes = area_code(leads)
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        columns = np.full(len(uniques), -1, dtype=np.int64)
+        for i, ac in enumerate(uniques):
+            if ac < 0:
+                continue  # missing
+            if update:
+                columns[i] = self._column('AC', int(ac))
+            else:
+                columns[i] = self.columns_.get(('AC', int(ac)), -1)
+        return columns[inverse]
+
+    def _numeric_values(self, leads, block):
+        if block == 'Contact':
+            return contact_codes(leads)
+        values = leads[block].to_numpy(dtype=np.float64)
+        if self.na_fill is not None:
+            values = np.where(np.isnan(values), self.na_fill, values)
+        return values
+
+    def _matrix(self, leads, block=None, remap=None):
+        # CSR matrix of leads in the current layout, one slot per (lead, feature block) as in transform_sparse
+        n = leads.shape[0]
+        cols = np.empty((n, len(self.blocks)), dtype=np.int64)
+        vals = np.ones((n, len(self.blocks)), dtype=self.dtype)
+        for j, b in enumerate(self.blocks):
+            if b in NUMERIC_BLOCKS:
+                cols[:, j] = self.columns_[(b, None)]
+                vals[:, j] = self._numeric_values(leads, b)
+            elif b == 'TOB':
+                cols[:, j] = self._tob_columns(leads, block, remap)
+            elif b == 'AC':
+                cols[:, j] = self._ac_columns(leads, update=block is not None)
+            else:
+                codes = website_extension(leads, self.extensions).codes.astype(np.int64)
+                cols[:, j] = self.columns_[('EX', 'none')] + codes
+        keep = (cols >= 0) & (vals != 0)
+
+        # Columns are appended in the order categories appear, so sort each row's entries by column
+        cols = np.where(keep, cols, np.iinfo(np.int64).max)
+        order = np.argsort(cols, axis=1, kind='stable')
+        cols = np.take_along_axis(cols, order, axis=1)
+        vals = np.take_along_axis(vals, order, axis=1)
+        keep = np.take_along_axis(keep, order, axis=1)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(keep.sum(axis=1), out=indptr[1:])
+        M = sparse.csr_matrix((vals[keep], cols[keep].astype(np.int32), indptr), shape=(n, len(self.feature_names_)))
+        M.has_sorted_indices = True
+        return M
+
+    #--------------------------------------------------
+    # Update and transform
+
+    def update(self, leads):
+        """Add a block of appended (training) leads: update the counts and layout and return their LeadDelta."""
+        block = self.n_blocks_
+        remap = []
+        M = self._matrix(leads, block=block, remap=remap)
+        self.n_blocks_ += 1
+        remap = pd.DataFrame(remap, columns=['Block', 'Row', 'FromColumn', 'ToColumn'], dtype=np.int64)
+        return LeadDelta(block, M, remap, len(self.feature_names_))
+
+    def transform_sparse(self, leads):
+        """
+        CSR matrix of leads in the current layout, without updating anything (e.g. to score new leads). Business types
+        and AreaCodes never seen get no column
+        """
+        return self._matrix(leads)
+
+
+def apply_remap(matrices, delta):
+    """
+    Bring stored blocks up to date with a LeadDelta: move the remapped rows' 1s to their new columns and widen every
+    block to delta.n_features columns. matrices[i] is the block with index i. Returns the updated list
+
+    Only blocks with remapped rows are copied; the others are widened as new CSR matrices that share their arrays, so
+    the cost grows with the number of moved rows, not with the rows stored.
+    """
+    moves_by_block = {block: moves for block, moves in delta.remap.groupby('Block')}
+    updated = []
+    for block, M in enumerate(matrices):
+        M = M.tocsr()
+        moves = moves_by_block.get(block)
+        if moves is None:
+            if M.shape[1] != delta.n_features:
+                M = sparse.csr_matrix((M.data, M.indices, M.indptr), shape=(M.shape[0], delta.n_features))
+            updated.append(M)
+            continue
+        M = M.copy()
+        for row, from_col, to_col in moves[['Row', 'FromColumn', 'ToColumn']].itertuples(index=False, name=None):
+            start, stop = M.indptr[row], M.indptr[row + 1]
+            hit = np.flatnonzero(M.indices[start:stop] == from_col)
+            if len(hit) != 1:
+                raise ValueError("Block {} row {} has no entry in column {}".format(block, row, from_col))
+            M.indices[start + hit[0]] = to_col
+        M.has_sorted_indices = False
+        M.sort_indices()
+        M.resize((M.shape[0], delta.n_features))
+        updated.append(M)
+    return updated
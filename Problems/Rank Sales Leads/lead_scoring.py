@@ -0,0 +1,173 @@
+# Chunked (streaming) scoring and ranking of sales leads
+
+# Notes about this module:
+# The rank_leads_* scripts read the whole test set, predict, and then sort the full frame by ProbSale. rank_leads()
+# instead reads the leads in chunks, featurizes each chunk with a fitted LeadFeaturizer and scores it with a trained
+# RandomForestClassifier, LogisticRegression or xgboost Booster. Only a bounded amount of data is ever held in memory:
+# - with top_k, a heap of the k most likely leads is kept and returned as a DataFrame
+# - without top_k, every chunk is sorted and spilled to disk as a sorted run, and the runs are merged into the output csv.
+#   At most max_open_runs run files are open at once: with more runs than that, groups of them are first merged into
+#   longer runs, in as many passes as needed
+# Ties in ProbSale are ranked by the order the leads appear in the input file, i.e. the same ranking as
+# test.sort_values('ProbSale', ascending=False, kind='mergesort') on the in-memory path.
+#
+# Usage (assumes your current working directory is the Rank Sales Leads problem directory):
+#   featurizer = LeadFeaturizer().fit(train)
+#   rf.fit(X=featurizer.transform(train), y=train.Sale.values)
+#   top100 = rank_leads("_Data/test.csv", featurizer, rf, top_k=100)
+#   rank_leads("_Data/test.csv", featurizer, rf, out_path="ranked.csv")  # full ranking, flat memory
+#   evaluate_leads("_Data/test.csv", featurizer, rf).score()  # AUC without holding every score in memory
+
+import csv
+import heapq
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join("..", ".."))
+from mlpb.metrics import StreamingAUC
+from mlpb.schema import LEADS
+
+KEEP_COLUMNS = ['LeadID', 'CompanyName']
+
+# Most sorted runs merged at once (each is an open file)
+MAX_OPEN_RUNS = 64
+
+#======================================================================================================
+# Scoring
+
+
+def predict_prob_sale(featurizer, model, leads):
+    """Probability of a sale for each lead in a DataFrame, using a fitted featurizer and a trained model."""
+    if hasattr(model, 'predict_proba'):
+        # scikit-learn model
+        return model.predict_proba(featurizer.transform(leads))[:, 1]
+
+    # xgboost Booster (imported here so that scikit-learn users don't need xgboost installed)
+    import xgboost as xgb
+    M = xgb.DMatrix(data=featurizer.transform_sparse(leads), feature_names=featurizer.feature_names_)
+    return model.predict(M)
+
+
+def read_leads(path, chunksize, extra_columns=()):
+    """
+    Iterate over a leads csv in DataFrame chunks, with the compact dtypes of mlpb.schema.LEADS
+
+    extra_columns: columns that aren't in LEADS (e.g. PhoneNumber) to read as text as well
+    """
+    return LEADS.read_chunks(path, chunksize, extra_columns=extra_columns)
+
+
+def evaluate_leads(path, featurizer, model, chunksize=100000, bins=10000):
+    """StreamingAUC of ProbSale against Sale for the leads in a csv, accumulated chunk by chunk."""
+    auc = StreamingAUC(bins=bins)
+    for chunk in read_leads(path, chunksize):
+        auc.update(y_true=chunk.Sale.values, y_score=predict_prob_sale(featurizer, model, chunk))
+    return auc
+
+#======================================================================================================
+# Ranking
+
+
+def rank_leads(path, featurizer, model, chunksize=100000, top_k=None, out_path=None, keep_columns=KEEP_COLUMNS,
+               spill_dir=None, max_open_runs=MAX_OPEN_RUNS):
+    """
+    Score the leads in a csv chunk by chunk and rank them from most likely to least likely to convert to a sale
+
+    top_k: if given, return a DataFrame of the top_k leads (keep_columns + ProbSale + ProbSaleRk). keep_columns can be
+      any columns of the csv; those that aren't in mlpb.schema.LEADS are kept as text
+    out_path: if given (and top_k is not), write every lead to this csv in rank order and return the number of leads.
+      Sorted runs are spilled to a temporary directory inside spill_dir (default: the system temp directory)
+    max_open_runs: most run files merged (and open) at once
+    """
+    if top_k is None and out_path is None:
+        raise ValueError("Either top_k or out_path must be given")
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be at least 1 (got {})".format(top_k))
+    if max_open_runs < 2:
+        raise ValueError("max_open_runs must be at least 2 (got {})".format(max_open_runs))
+
+    chunks = read_leads(path, chunksize, extra_columns=[c for c in keep_columns if c not in LEADS.columns])
+    if top_k is not None:
+        return _rank_top_k(chunks, featurizer, model, top_k, keep_columns)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmpdir:
+        return _rank_spilled(chunks, featurizer, model, out_path, keep_columns, tmpdir, max_open_runs)
+
+
+def _rank_top_k(chunks, featurizer, model, top_k, keep_columns):
+    # Min-heap of (ProbSale, -row) so the least likely lead (latest row among ties) is the one pushed out
+    heap = []
+    row = 0
+    for chunk in chunks:
+        probs = predict_prob_sale(featurizer, model, chunk)
+
+        # Only leads that could make the cut need to be turned into heap entries
+        candidates = np.arange(len(probs))
+        if len(heap) == top_k:
+            candidates = candidates[probs >= heap[0][0]]
+        kept = chunk[keep_columns].iloc[candidates].itertuples(index=False, name=None)
+        for i, values in zip(candidates, kept):
+            entry = (probs[i], -(row + i), values)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        row += len(probs)
+
+    heap.sort(key=lambda entry: entry[:2], reverse=True)
+    ranked = pd.DataFrame([entry[2] for entry in heap], columns=keep_columns)
+    ranked['ProbSale'] = [entry[0] for entry in heap]
+    ranked['ProbSaleRk'] = np.arange(ranked.shape[0])
+    return ranked
+
+
+def _merged_runs(paths):
+    # k-way merge of sorted run files. %.17g round trips exactly, so the merge sees the same ProbSale values
+    files = [open(path, newline='') for path in paths]
+    try:
+        readers = [csv.reader(f) for f in files]
+        yield from heapq.merge(*readers, key=lambda rec: (-float(rec[0]), int(rec[1])))
+    finally:
+        for f in files:
+            f.close()
+
+
+def _rank_spilled(chunks, featurizer, model, out_path, keep_columns, tmpdir, max_open_runs):
+    # Write each scored chunk to disk as a run sorted by (ProbSale desc, row asc)
+    runs = []
+    row = 0
+    for chunk in chunks:
+        run = chunk[keep_columns].copy()
+        run.insert(0, 'Row', np.arange(row, row + run.shape[0]))
+        run.insert(0, 'ProbSale', predict_prob_sale(featurizer, model, chunk))
+        run.sort_values(['ProbSale', 'Row'], ascending=[False, True], inplace=True)
+        runs.append(os.path.join(tmpdir, 'run{}.csv'.format(len(runs))))
+        run.to_csv(runs[-1], index=False, header=False, float_format='%.17g')
+        row += run.shape[0]
+
+    # Merge groups of max_open_runs runs into longer runs until the rest fit in one merge
+    n_runs = len(runs)
+    while len(runs) > max_open_runs:
+        merged = []
+        for start in range(0, len(runs), max_open_runs):
+            group = runs[start:start + max_open_runs]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged.append(os.path.join(tmpdir, 'run{}.csv'.format(n_runs)))
+            n_runs += 1
+            with open(merged[-1], 'w', newline='') as out:
+                csv.writer(out).writerows(_merged_runs(group))
+            for path in group:
+                os.remove(path)
+        runs = merged
+
+    with open(out_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(keep_columns + ['ProbSale', 'ProbSaleRk'])
+        for rank, rec in enumerate(_merged_runs(runs)):
+            writer.writerow(rec[2:] + [rec[0], rank])
+
+    return row
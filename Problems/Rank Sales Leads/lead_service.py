@@ -0,0 +1,360 @@
+# Online scoring of single leads over a local HTTP endpoint
+
+# Notes about this module:
+# The rank_leads_* scripts score leads as a DataFrame: fine for a batch, but for one lead the pandas work (string methods,
+# get_indexer, categoricals) costs far more than the model. OnlineLeadScorer compiles a fitted LeadFeaturizer into plain
+# dicts once - TypeOfBusiness, AreaCode and Contact straight to their column, the website regex precompiled - and turns
+# each lead (a dict with the columns of train.csv) into a row of a preallocated matrix with a handful of dict lookups.
+# The features are identical to LeadFeaturizer.transform, so a lead gets the same ProbSale online as in a batch.
+#
+# serve() answers POST /score requests (a JSON lead, or a list of them) on an asyncio HTTP server. Each request's leads
+# are validated and featurized as soon as it arrives, so a bad lead gets a 400 reply without affecting anyone else's.
+# The feature rows of requests that arrive while a batch is being scored are queued and scored together in the next
+# model call (micro-batching), so a burst of concurrent requests costs a few model calls instead of one each. If the
+# model call fails, the requests in that batch get a 500 reply. The model runs in a worker thread, so the event loop
+# keeps accepting requests meanwhile.
+#
+# Usage (assumes your current working directory is the Rank Sales Leads problem directory):
+#   scorer = OnlineLeadScorer(featurizer, rf)  # a fitted LeadFeaturizer and RandomForestClassifier/Booster/...
+#   scorer.score({'TypeOfBusiness': 'Bakery', 'PhoneNumber': '5125551234', 'Contact': 'owner', ...})
+#   scorer.save("scorer.pkl")
+#   python lead_service.py scorer.pkl --port 8080
+#   curl -d '{"PhoneNumber": "5125551234", "Contact": "owner"}' localhost:8080/score   # {"ProbSale": 0.41}
+#
+# score_file() ranks a csv of leads with a saved scorer. Called through the warm worker in mlpb/lazy.py, the scorer
+# (and pandas, scikit-learn...) stay loaded between calls:
+#   python ../../mlpb/lazy.py call lead_service:score_file scorer.pkl _Data/test.csv --kwargs '{"top_k": 10}'
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import pickle
+import re
+import numpy as np
+from lead_features import CONTACTS, NUMERIC_BLOCKS, TLD_PATTERN
+from lead_scoring import rank_leads
+
+from mlpb.lazy import resident
+from mlpb.schema import area_code
+
+#======================================================================================================
+# Scorer
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _hashable(lead, column):
+    # A lead's value used as a lookup key (e.g. a JSON list would raise a TypeError in the dict lookup)
+    value = lead.get(column)
+    try:
+        hash(value)
+    except TypeError:
+        raise ValueError("{} must be a single value (got {!r})".format(column, value))
+    return value
+
+
+class OnlineLeadScorer(object):
+    """
+    Scores lead dicts with a fitted LeadFeaturizer and a trained model
+
+    model: anything with predict_proba (scikit-learn) or an xgboost Booster
+    max_batch: rows of the preallocated feature matrix (larger batches are scored in pieces)
+    """
+
+    def __init__(self, featurizer, model, max_batch=256):
+        self.featurizer = featurizer
+        self.model = model
+        self.max_batch = max_batch
+        self.n_features = len(featurizer.feature_names_)
+        self._compile()
+
+    def _compile(self):
+        f = self.featurizer
+        self.contacts_ = {c: float(i) for i, c in enumerate(CONTACTS)}
+        self.tob_columns_ = {}
+        if 'TOB' in f.blocks:
+            self.tob_columns_ = {tob: f.offsets_['TOB'] + int(code) for tob, code in zip(f.tob_index_, f.tob_codes_)}
+        self.ac_columns_ = {}
+        if 'AC' in f.blocks:
+            self.ac_columns_ = {int(ac): f.offsets_['AC'] + i for i, ac in enumerate(f.ac_categories_)}
+        self.ex_columns_ = {}
+        if 'EX' in f.blocks:
+            self.ex_columns_ = {ex: f.offsets_['EX'] + i for i, ex in enumerate(f.ex_categories_)}
+        self._tld = re.compile(TLD_PATTERN)
+        self._numeric = [(f.offsets_[b], b) for b in f.blocks if b in NUMERIC_BLOCKS]
+        self._X = np.zeros((self.max_batch, self.n_features), dtype=f.dtype)
+
+    def __getstate__(self):
+        # The compiled lookups and the buffer are rebuilt on load
+        return {'featurizer': self.featurizer, 'model': self.model, 'max_batch': self.max_batch}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    #--------------------------------------------------
+    # Features
+
+    def features(self, lead, row):
+        """
+        Write the features of one lead dict into row (a zeroed vector of length n_features). Raises a ValueError for
+        values that can't be featurized (e.g. a FacebookLikes that isn't a number)
+        """
+        f = self.featurizer
+        for offset, block in self._numeric:
+            if block == 'Contact':
+                row[offset] = self.contacts_.get(_hashable(lead, 'Contact'), -1.0)
+            else:
+                value = lead.get(block)
+                try:
+                    value = np.nan if _missing(value) else float(value)
+                except (TypeError, ValueError):
+                    raise ValueError("{} must be a number (got {!r})".format(block, value))
+                if f.na_fill is not None and value != value:
+                    value = f.na_fill
+                row[offset] = value
+
+        if self.tob_columns_:
+            tob = _hashable(lead, 'TypeOfBusiness')
+            col = self.tob_columns_.get('NA_Val' if _missing(tob) else tob)
+            if col is not None:
+                row[col] = 1
+
+        if self.ac_columns_:
+            ac = _hashable(lead, 'AreaCode')
+            if _missing(ac):
+                ac = area_code(lead.get('PhoneNumber'))  # parsed exactly as the batch path does
+            col = self.ac_columns_.get(ac)
+            if col is not None:
+                row[col] = 1
+
+        if self.ex_columns_:
+            website = lead.get('Website')
+            if _missing(website):
+                ex = 'none'
+            else:
+                match = self._tld.match(str(website).strip().lower())
+                ex = match.group(1) if match else None
+                ex = ex if ex in f.extensions_ else 'other'
+            row[self.ex_columns_[ex]] = 1
+        return row
+
+    #--------------------------------------------------
+    # Scoring
+
+    def featurize(self, leads):
+        """Feature matrix of a list of lead dicts (a ValueError names the first lead that can't be featurized)."""
+        X = np.zeros((len(leads), self.n_features), dtype=self.featurizer.dtype)
+        for i, (lead, row) in enumerate(zip(leads, X)):
+            try:
+                self.features(lead, row)
+            except ValueError as e:
+                raise ValueError("lead {}: {}".format(i, e))
+        return X
+
+    def predict(self, X):
+        """ProbSale for each row of a feature matrix (see featurize())."""
+        if hasattr(self.model, 'predict_proba'):
+            return self.model.predict_proba(X)[:, 1]
+        # xgboost Booster: predict straight from the buffer, no DMatrix. The batch path (transform_sparse) leaves zeros
+        # out of the matrix, so zeros are missing here too (NaN always is)
+        return self.model.inplace_predict(X, missing=0.0)
+
+    def score_many(self, leads):
+        """ProbSale for each lead dict in a list."""
+        probs = np.empty(len(leads))
+        for start in range(0, len(leads), self.max_batch):
+            batch = leads[start:start + self.max_batch]
+            X = self._X[:len(batch)]
+            X[...] = 0
+            for lead, row in zip(batch, X):
+                self.features(lead, row)
+            probs[start:start + len(batch)] = self.predict(X)
+        return probs
+
+    def score(self, lead):
+        """ProbSale of one lead dict."""
+        return float(self.score_many([lead])[0])
+
+
+def score_file(scorer_path, csv_path, top_k=None, out_path=None, chunksize=100000):
+    """
+    Rank the leads in a csv with a saved OnlineLeadScorer (see lead_scoring.rank_leads for top_k and out_path)
+
+    The scorer is loaded once per process and file version, so repeated calls in the warm worker skip unpickling it.
+    """
+    key = ('OnlineLeadScorer', os.path.abspath(scorer_path), os.path.getmtime(scorer_path))
+    scorer = resident(key, lambda: OnlineLeadScorer.load(scorer_path))
+    return rank_leads(csv_path, scorer.featurizer, scorer.model, chunksize=chunksize, top_k=top_k, out_path=out_path)
+
+#======================================================================================================
+# Micro-batching
+
+
+class MicroBatcher(object):
+    """
+    Collects the feature rows of concurrent score requests and scores them together
+
+    Every request waiting when a batch starts (up to max_batch rows) joins it. max_wait (seconds) is how long the first
+    request of an idle period waits for company before it is scored.
+    """
+
+    def __init__(self, scorer, max_batch=256, max_wait=0.001):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_sizes = []  # size of every batch scored, for monitoring
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def score(self, X):
+        """ProbSale for each row of a feature matrix from scorer.featurize() (awaits the batch it joins)."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            if self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+            n = len(requests[0][0])
+            while not self._queue.empty() and n < self.max_batch:
+                requests.append(self._queue.get_nowait())
+                n += len(requests[-1][0])
+
+            # Requests whose client has gone away (their future was cancelled) are dropped
+            requests = [(X, future) for X, future in requests if not future.done()]
+            if not requests:
+                continue
+            X = np.concatenate([X for X, _ in requests])
+            try:
+                probs = await loop.run_in_executor(None, self.scorer.predict, X)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_sizes.append(len(X))
+            start = 0
+            for X, future in requests:
+                if not future.done():
+                    future.set_result(probs[start:start + len(X)].tolist())
+                start += len(X)
+
+#======================================================================================================
+# HTTP endpoint
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+async def _respond(writer, status, body):
+    payload = json.dumps(body).encode()
+    writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                 .format(status, STATUS[status], len(payload)).encode() + payload)
+    await writer.drain()
+
+
+async def _score_body(batcher, body):
+    # (status, reply) for a POST /score body: 400 if it isn't a lead or a list of valid leads, 500 if the model fails
+    try:
+        leads = json.loads(body)
+    except ValueError as e:
+        return 400, {'error': 'invalid JSON: {}'.format(e)}
+    single = isinstance(leads, dict)
+    leads = [leads] if single else leads
+    if not (isinstance(leads, list) and all(isinstance(lead, dict) for lead in leads)):
+        return 400, {'error': 'expected a lead object or a list of them'}
+    try:
+        X = batcher.scorer.featurize(leads)
+    except ValueError as e:
+        return 400, {'error': 'invalid lead: {}'.format(e)}
+    try:
+        probs = await batcher.score(X)
+    except Exception as e:
+        return 500, {'error': 'scoring failed: {}: {}'.format(type(e).__name__, e)}
+    return 200, {'ProbSale': probs[0] if single else probs}
+
+
+async def _handle(batcher, reader, writer):
+    # One connection: HTTP/1.1 requests until the client closes it
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if path == '/health':
+                await _respond(writer, 200, {'status': 'ok'})
+            elif path != '/score':
+                await _respond(writer, 404, {'error': 'unknown path {}'.format(path)})
+            elif method != 'POST':
+                await _respond(writer, 405, {'error': 'use POST'})
+            else:
+                await _respond(writer, *(await _score_body(batcher, body)))
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(scorer, host='127.0.0.1', port=8080, max_batch=256, max_wait=0.001, ready=None):
+    """
+    Serve POST /score (and GET /health) until cancelled
+
+    ready: optional asyncio.Event set once the server is listening
+    """
+    batcher = MicroBatcher(scorer, max_batch=max_batch, max_wait=max_wait)
+    batcher.start()
+    server = await asyncio.start_server(lambda r, w: _handle(batcher, r, w), host, port)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve ProbSale scores for single leads over HTTP")
+    parser.add_argument('scorer', help="pickle written by OnlineLeadScorer.save()")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-wait', type=float, default=0.001, help="seconds a request waits for others to batch with")
+    args = parser.parse_args()
+    asyncio.run(serve(OnlineLeadScorer.load(args.scorer), args.host, args.port, max_wait=args.max_wait))
@@ -11,24 +11,33 @@ import numpy as np
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import roc_auc_score
+from lead_features import LeadFeaturizer
 
-# Display Settings
-pd.set_option('display.max_rows', 10)
-pd.set_option('display.max_columns', 20)
-pd.set_option('display.width', 190)
+from mlpb.lazy import configure_display
+from mlpb.profiling import Profiler
+from mlpb.schema import LEADS
+
+# Display Settings (only applied in an interactive session)
+configure_display(max_rows=10, max_columns=20, width=190)
 
 # # Set working directory
 # os.chdir("/Path/To/Rank Sales Leads")
 
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("rank_leads_logreg")
+
 #======================================================================================================
 # Load Data (Assumes your current working directory is the Rank Sales Leads problem directory)
 
-train = pd.read_csv("_Data/train.csv", usecols=['LeadID', 'CompanyName', 'PhoneNumber', 'Contact', 'Sale'], dtype={'PhoneNumber':str})
-test = pd.read_csv("_Data/test.csv", usecols=['LeadID', 'CompanyName', 'PhoneNumber', 'Contact', 'Sale'], dtype={'PhoneNumber':str})
+profiler.mark("Load Data")
+train = LEADS.read("_Data/train.csv", columns=['LeadID', 'CompanyName', 'AreaCode', 'Contact', 'Sale'])
+test = LEADS.read("_Data/test.csv", columns=['LeadID', 'CompanyName', 'AreaCode', 'Contact', 'Sale'])
 
 #======================================================================================================
 # Really quick and dirty analysis
 
+profiler.mark("Really quick and dirty analysis")
+
 # View the raw data
 train
 
@@ -42,46 +51,40 @@ train.Sale.sum()/train.shape[0]  # .35
 #======================================================================================================
 # Feature engineering and transforming the training dataset
 
+profiler.mark("Feature engineering and transforming the training dataset")
+
 # Some things to keep in mind
 # - logistic regression only accepts numeric and logical values. So we need to convert Contact to numeric
 # - We need to extract AreaCode from PhoneNumber, and then one-hot-encode them (because it doesn't make sense to order AreadCodes)
 # - The test set could have an AreaCode not seen in the train set (it doesn't, but it could. So we'll account for that)
 
 #--------------------------------------------------
-# AreaCode
-
-# train
-train['AreaCode'] = train.PhoneNumber.str[:3]
-train['AreaCode'] = pd.Categorical(train.AreaCode)
-train_areacode_dummies = pd.get_dummies(train.AreaCode, prefix='AC')
-train = pd.concat([train, train_areacode_dummies], axis=1)
-
-# test
-test['AreaCode'] = test.PhoneNumber.str[:3]
-test['AreaCode'] = pd.Categorical(test.AreaCode, categories=train.AreaCode.cat.categories)
-test_areacode_dummies = pd.get_dummies(test.AreaCode, prefix='AC')
-test = pd.concat([test, test_areacode_dummies], axis=1)
-
-#--------------------------------------------------
-# Contact (convert to numeric, 1-4)
-
-# In this case, we know all the possible contact types
-contacts = ["general line", "other", "manager", "owner"]  # Note the order of the elements
-train['Contact'] = pd.Categorical(train.Contact, categories=contacts, ordered=True).codes
-test['Contact'] = pd.Categorical(test.Contact, categories=contacts, ordered=True).codes
+# Build the model matrices
+#
+# LeadFeaturizer (see lead_features.py) learns its category lookups from train and then transforms train and test
+# the same way:
+# - Contact: convert to numeric, ordered general line < other < manager < owner
+# - AreaCode: one-hot-encode the area code, which LEADS parses from PhoneNumber as an integer (an AreaCode not seen in train gets all 0s)
+
+featurizer = LeadFeaturizer(blocks=['Contact', 'AC'])
+featurizer.fit(train)
+train_X = featurizer.transform(train)
+test_X = featurizer.transform(test)
 
 #======================================================================================================
 # Logistic Regression Model
 
-features = ['Contact'] + train_areacode_dummies.columns.tolist()
+profiler.mark("Logistic Regression Model", rows=train.shape[0])
+features = featurizer.feature_names_
 
 logreg = LogisticRegression(C=1.0)  # Note that C controls the effect regularization
-logreg.fit(X=train[features].values, y=train.Sale.values)
+logreg.fit(X=train_X, y=train.Sale.values)
 
 #======================================================================================================
 # Make some predictions on the test set & evaluate the results
 
-test['ProbSale'] = logreg.predict_proba(test[features].values)[:, 1]
+profiler.mark("Make some predictions on the test set & evaluate the results", rows=test.shape[0])
+test['ProbSale'] = logreg.predict_proba(test_X)[:, 1]
 
 #--------------------------------------------------
 # Rank the predictions from most likely to least likely
@@ -98,3 +101,5 @@ test[['ProbSaleRk', 'CompanyName', 'ProbSale', 'Sale']]  # Looks perty good!
 # Evaluate the results using area under the ROC curve
 
 roc_auc_score(y_true=test.Sale, y_score=test.ProbSale)  # 1
+
+profiler.finish()
@@ -10,24 +10,37 @@ import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score
+import lead_features
+from lead_features import LeadFeaturizer
 
-# Display Settings
-pd.set_option('display.max_rows', 10)
-pd.set_option('display.max_columns', 20)
-pd.set_option('display.width', 190)
+from mlpb import schema
+from mlpb.cache import ArtifactCache
+from mlpb.lazy import configure_display
+from mlpb.inference import BlockPredictor
+from mlpb.profiling import Profiler
+from mlpb.schema import LEADS
+
+# Display Settings (only applied in an interactive session)
+configure_display(max_rows=10, max_columns=20, width=190)
 
 # # Set working directory
 # os.chdir("/Path/To/Rank Sales Leads")
 
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("rank_leads_rf1")
+
 #======================================================================================================
 # Load Data (Assumes your current working directory is the Rank Sales Leads problem directory)
 
-train = pd.read_csv("_Data/train.csv", dtype={'PhoneNumber':str})
-test = pd.read_csv("_Data/test.csv", dtype={'PhoneNumber':str})
+profiler.mark("Load Data")
+train = LEADS.read("_Data/train.csv")  # compact dtypes (see mlpb/schema.py): categories, float32, AreaCode as int16
+test = LEADS.read("_Data/test.csv")
 
 #======================================================================================================
 # Really quick and dirty analysis
 
+profiler.mark("Really quick and dirty analysis")
+
 # View the raw data
 train
 
@@ -43,6 +56,8 @@ train.Sale.sum()/train.shape[0]  # .35
 #======================================================================================================
 # Feature engineering and transforming the training dataset
 
+profiler.mark("Feature engineering and transforming the training dataset")
+
 # Some things to keep in mind
 # - We have to deal with missing values (NaNs). We could impute mean or median into their place, but this is likely to degrade
 #   the model's performace. NaNs here have special meaning. E.g. FacebookLikes = NaN means the company does not have a facebook.
@@ -51,95 +66,35 @@ train.Sale.sum()/train.shape[0]  # .35
 #   unordered categorical fields (keeping in mind that a new category might arise in the test set)
 
 #--------------------------------------------------
-# TypeOfBusiness
-
-# Convert NaN to "NA_Val"
-train.TypeOfBusiness.fillna('NA_Val', inplace=True)
-test.TypeOfBusiness.fillna('NA_Val', inplace=True)
-
-# To help avoid overfitting, and to reduce the number of columns generated from one-hot-encoding,
-# we will mark uncommon business types as "other" (freq <= 1)
-tobMap = train.groupby('TypeOfBusiness')['TypeOfBusiness'].agg({'count'}).reset_index()
-tobMap['TOBGroup'] = tobMap.TypeOfBusiness
-tobMap.loc[tobMap['count'] <= 1, 'TOBGroup'] = 'other'
-train = train.merge(tobMap.drop('count', axis=1), on='TypeOfBusiness', how='left')
-test = test.merge(tobMap.drop('count', axis=1), on='TypeOfBusiness', how='left')
-
-# one-hot-encode
-tob_groups = tobMap.TOBGroup.unique()
-train['TOBGroup'] = pd.Categorical(train.TOBGroup, categories=tob_groups)
-train_tob_dummies = pd.get_dummies(train.TOBGroup, prefix='TOB')
-train = pd.concat([train, train_tob_dummies], axis=1)
-test['TOBGroup'] = pd.Categorical(test.TOBGroup, categories=tob_groups)
-test_tob_dummies = pd.get_dummies(test.TOBGroup, prefix='TOB')
-test = pd.concat([test, test_tob_dummies], axis=1)
-
-#--------------------------------------------------
-# Website Extension
-
-extensions = ['none', 'com', 'org', 'net', 'other']
-
-# train
-train.loc[train.Website.isnull(), 'WebsiteExtension'] = 'none'
-train.loc[train.Website.str.contains('com').replace(np.nan, False), 'WebsiteExtension'] = 'com'
-train.loc[train.Website.str.contains('org').replace(np.nan, False), 'WebsiteExtension'] = 'org'
-train.loc[train.Website.str.contains('net').replace(np.nan, False), 'WebsiteExtension'] = 'net'
-train.loc[train.WebsiteExtension.isnull(), 'WebsiteExtension'] = 'other'
-train['WebsiteExtension'] = pd.Categorical(train.WebsiteExtension, categories=extensions)
-train_extension_dummies = pd.get_dummies(train.WebsiteExtension, prefix='EX')
-train = pd.concat([train, train_extension_dummies], axis=1)
-
-# test
-test.loc[test.Website.isnull(), 'WebsiteExtension'] = 'none'
-test.loc[test.Website.str.contains('com').replace(np.nan, False), 'WebsiteExtension'] = 'com'
-test.loc[test.Website.str.contains('org').replace(np.nan, False), 'WebsiteExtension'] = 'org'
-test.loc[test.Website.str.contains('net').replace(np.nan, False), 'WebsiteExtension'] = 'net'
-test.loc[test.WebsiteExtension.isnull(), 'WebsiteExtension'] = 'other'
-test['WebsiteExtension'] = pd.Categorical(test.WebsiteExtension, categories=extensions)
-test_extension_dummies = pd.get_dummies(test.WebsiteExtension, prefix='EX')
-test = pd.concat([test, test_extension_dummies], axis=1)
-
-#--------------------------------------------------
-# AreaCode
-
-# train
-train['AreaCode'] = train.PhoneNumber.str[:3]
-train['AreaCode'] = pd.Categorical(train.AreaCode)
-train_areacode_dummies = pd.get_dummies(train.AreaCode, prefix='AC')
-train = pd.concat([train, train_areacode_dummies], axis=1)
-
-# test
-test['AreaCode'] = test.PhoneNumber.str[:3]
-test['AreaCode'] = pd.Categorical(test.AreaCode, categories=train.AreaCode.cat.categories)
-test_areacode_dummies = pd.get_dummies(test.AreaCode, prefix='AC')
-test = pd.concat([test, test_areacode_dummies], axis=1)
-
-#--------------------------------------------------
-# Contact (convert to numeric, 1-4)
-
-# In this case, we know all the possible contact types
-contacts = ["general line", "other", "manager", "owner"]  # Note the order of the elements
-train['Contact'] = pd.Categorical(train.Contact, categories=contacts, ordered=True).codes
-test['Contact'] = pd.Categorical(test.Contact, categories=contacts, ordered=True).codes
-
-#--------------------------------------------------
-# FacebookLikes
-
-train.FacebookLikes.fillna(-1, inplace=True)
-test.FacebookLikes.fillna(-1, inplace=True)
-
-#--------------------------------------------------
-# TwitterFollowers
-
-train.TwitterFollowers.fillna(-1, inplace=True)
-test.TwitterFollowers.fillna(-1, inplace=True)
+# Build the model matrices
+#
+# LeadFeaturizer (see lead_features.py) learns its category lookups from train and then transforms train and test
+# the same way:
+# - TypeOfBusiness: NaN becomes "NA_Val" and uncommon business types (freq <= 1) are marked as "other" to help avoid
+#   overfitting and to reduce the number of columns generated from one-hot-encoding. Then one-hot-encode
+# - AreaCode: one-hot-encode the area code, which LEADS parses from PhoneNumber as an integer (an AreaCode not seen in train gets all 0s)
+# - Contact: convert to numeric, ordered general line < other < manager < owner
+# - FacebookLikes, TwitterFollowers: fill NaN with -1
+
+# The fitted featurizer and model are cached on disk (see mlpb/cache.py), keyed by the training data, the feature code
+# (lead_features.py, and mlpb/schema.py which parses the data) and the parameters, so re-running the script with
+# unchanged inputs skips straight to prediction
+cache = ArtifactCache()
+
+featurizer_params = {'blocks': ['Contact', 'FacebookLikes', 'TwitterFollowers', 'TOB', 'AC'], 'min_tob_count': 2, 'na_fill': -1}
+featurizer_key = cache.key(data=["_Data/train.csv"], code=[lead_features, schema], params=featurizer_params)
+featurizer, _ = cache.get_or_create(featurizer_key, lambda: LeadFeaturizer(**featurizer_params).fit(train))
+train_X = featurizer.transform(train)
+test_X = featurizer.transform(test)
 
 #======================================================================================================
 # Random Forest Model
 
-features = ['Contact', 'FacebookLikes', 'TwitterFollowers'] + train_tob_dummies.columns.tolist() + train_areacode_dummies.columns.tolist() + test_areacode_dummies.columns.tolist()
-rf = RandomForestClassifier(n_estimators=200, max_features=.33, min_samples_leaf=3, random_state=2016)
-rf.fit(X=train[features].values, y=train.Sale.values)
+profiler.mark("Random Forest Model", rows=train.shape[0])
+features = featurizer.feature_names_
+rf_params = {'n_estimators': 200, 'max_features': .33, 'min_samples_leaf': 3, 'random_state': 2016}
+rf_key = cache.key(params={'featurizer': featurizer_key, 'rf': rf_params})
+rf, rf_cached = cache.get_or_create(rf_key, lambda: RandomForestClassifier(**rf_params).fit(X=train_X, y=train.Sale.values))
 
 #--------------------------------------------------
 # Check the importance of features
@@ -150,7 +105,10 @@ impotances.sort_values('Importance', ascending=False)
 #======================================================================================================
 # Make some predictions on the test set & evaluate the results
 
-test['ProbSale'] = rf.predict_proba(test[features].values)[:,1]
+profiler.mark("Make some predictions on the test set & evaluate the results", rows=test.shape[0])
+
+# Scored in blocks of rows on a thread pool (see mlpb/inference.py), so memory stays flat for large test sets
+test['ProbSale'] = BlockPredictor(rf, block_size=10000).predict_proba(test_X)[:,1]
 
 #--------------------------------------------------
 # Rank the predictions from most likely to least likely
@@ -167,3 +125,5 @@ test[['ProbSaleRk', 'CompanyName', 'ProbSale', 'Sale']]  # Looks perty good!
 # Evaluate the results using area under the ROC curve
 
 roc_auc_score(y_true=test.Sale, y_score=test.ProbSale)  # 0.75
+
+profiler.finish()
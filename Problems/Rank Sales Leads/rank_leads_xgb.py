@@ -9,27 +9,38 @@
 import os
 import numpy as np
 import pandas as pd
-from scipy import sparse
 import xgboost as xgb
 from sklearn.metrics import roc_auc_score
+import lead_features
+from lead_features import LeadFeaturizer
 
-# Display Settings
-pd.set_option('display.max_rows', 10)
-pd.set_option('display.max_columns', 20)
-pd.set_option('display.width', 190)
+from mlpb import schema
+from mlpb.cache import ArtifactCache
+from mlpb.lazy import configure_display
+from mlpb.profiling import Profiler
+from mlpb.schema import LEADS
+
+# Display Settings (only applied in an interactive session)
+configure_display(max_rows=10, max_columns=20, width=190)
 
 # # Set working directory
 # os.chdir("/Path/To/Rank Sales Leads")
 
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("rank_leads_xgb")
+
 #======================================================================================================
 # Load Data (Assumes your current working directory is the Rank Sales Leads problem directory)
 
-train = pd.read_csv("_Data/train.csv", dtype={'PhoneNumber':str})
-test = pd.read_csv("_Data/test.csv", dtype={'PhoneNumber':str})
+profiler.mark("Load Data")
+train = LEADS.read("_Data/train.csv")  # compact dtypes (see mlpb/schema.py): categories, float32, AreaCode as int16
+test = LEADS.read("_Data/test.csv")
 
 #======================================================================================================
 # Really quick and dirty analysis
 
+profiler.mark("Really quick and dirty analysis")
+
 # View the raw data
 train
 
@@ -45,111 +56,60 @@ train.Sale.sum()/train.shape[0]  # .35
 #======================================================================================================
 # Feature engineering and transforming the training dataset
 
+profiler.mark("Feature engineering and transforming the training dataset")
+
 # Some things to keep in mind
-# - Need to build a sparse matrix for each non-ordered categorical feature: TypeOfBusiness, AreaCode, and WebsiteExtension
-# - Need to concatenate all features into one big sparse matrix
+# - Need to one-hot-encode each non-ordered categorical feature: TypeOfBusiness, AreaCode, and WebsiteExtension
+# - Need to combine all features into one big sparse matrix
 # - XGBoost has smart handling for NA values, so we don't need to impute values for NA in FacebookLikes and TwitterFollowers
 
 #--------------------------------------------------
-# TypeOfBusiness
-
-# Convert NAs to "NA_Val"
-train.TypeOfBusiness.fillna("NA_Val", inplace=True)
-test.TypeOfBusiness.fillna("NA_Val", inplace=True)
-
-# Generate a map to map the values in TypeOfBusiness to a sparse matrix
-tobMap = pd.DataFrame({'TypeOfBusiness': train.TypeOfBusiness.unique()})
-tobMap['TOBColIdx'] = np.arange(tobMap.shape[0])
-
-# Build sparse matrix of train values
-train = train.merge(tobMap, on='TypeOfBusiness', how='left')
-trainTOBSparseM = sparse.csr_matrix((np.repeat(1, train.shape[0]), (train.index.values, train.TOBColIdx.values)))
-
-# Build sparse matrix of test values
-test = test.merge(tobMap, on='TypeOfBusiness', how='left')
-testTOBSparseM = sparse.csr_matrix((np.repeat(1, sum(test.TOBColIdx.notnull())), (test[test.TOBColIdx.notnull()].index.values, test[test.TOBColIdx.notnull()].TOBColIdx.values)), [test.shape[0], tobMap.shape[0]])
-
-#--------------------------------------------------
-# AreaCode
-
-train['AreaCode'] = train.PhoneNumber.str[:3]
-test['AreaCode'] = test.PhoneNumber.str[:3]
-
-# Generate a map to map the values in AreaCode to a sparse matrix
-areacodeMap = pd.DataFrame({'AreaCode': train.AreaCode.unique()})
-areacodeMap['AreaCodeColIdx'] = np.arange(areacodeMap.shape[0])
-
-# Build sparse matrix of train values
-train = train.merge(areacodeMap, on='AreaCode', how='left')
-trainAreaCodeSparseM = sparse.csr_matrix((np.repeat(1, train.shape[0]), (train.index.values, train.AreaCodeColIdx.values)))
-
-# Build sparse matrix of test values
-test = test.merge(areacodeMap, on='AreaCode', how='left')
-testAreaCodeSparseM = sparse.csr_matrix((np.repeat(1, sum(test.AreaCodeColIdx.notnull())), (test[test.AreaCodeColIdx.notnull()].index.values, test[test.AreaCodeColIdx.notnull()].AreaCodeColIdx.values)), [test.shape[0], areacodeMap.shape[0]])
-
-#--------------------------------------------------
-# Website Extension
-
-# train
-train.loc[train.Website.isnull(), 'WebsiteExtension'] = 'none'
-train.loc[train.Website.str.contains('com').replace(np.nan, False), 'WebsiteExtension'] = 'com'
-train.loc[train.Website.str.contains('org').replace(np.nan, False), 'WebsiteExtension'] = 'org'
-train.loc[train.Website.str.contains('net').replace(np.nan, False), 'WebsiteExtension'] = 'net'
-train.loc[train.WebsiteExtension.isnull(), 'WebsiteExtension'] = 'other'
-
-# test
-test.loc[test.Website.isnull(), 'WebsiteExtension'] = 'none'
-test.loc[test.Website.str.contains('com').replace(np.nan, False), 'WebsiteExtension'] = 'com'
-test.loc[test.Website.str.contains('org').replace(np.nan, False), 'WebsiteExtension'] = 'org'
-test.loc[test.Website.str.contains('net').replace(np.nan, False), 'WebsiteExtension'] = 'net'
-test.loc[test.WebsiteExtension.isnull(), 'WebsiteExtension'] = 'other'
-
-# Generate a map to map the values in WebsiteExtension to a sparse matrix
-extensionMap = pd.DataFrame({'WebsiteExtension': train.WebsiteExtension.unique()})
-extensionMap['ExtensionColIdx'] = np.arange(extensionMap.shape[0])
-
-# Build sparse matrix of train values
-train = train.merge(extensionMap, on='WebsiteExtension', how='left')
-trainExtensionSparseM = sparse.csr_matrix((np.repeat(1, train.shape[0]), (train.index.values, train.ExtensionColIdx.values)))
-
-# Build sparse matrix of test values
-test = test.merge(extensionMap, on='WebsiteExtension', how='left')
-testExtensionSparseM = sparse.csr_matrix((np.repeat(1, sum(test.ExtensionColIdx.notnull())), (test[test.ExtensionColIdx.notnull()].index.values, test[test.ExtensionColIdx.notnull()].ExtensionColIdx.values)), [test.shape[0], extensionMap.shape[0]])
-
-#--------------------------------------------------
-# Contact (convert to numeric, 1-4)
-
-# In this case, we know all the possible contact types
-contacts = ["general line", "other", "manager", "owner"]  # Note the order of the elements
-train['Contact'] = pd.Categorical(train.Contact, categories=contacts, ordered=True).codes
-test['Contact'] = pd.Categorical(test.Contact, categories=contacts, ordered=True).codes
-
-#--------------------------------------------------
-# Combine training features into a single sparse matrix and then convert to xgb.DMatrix type
-
-# Insert the non sparse features into a sparse matrix
-trainNonSparseFeats = sparse.csr_matrix(train[['Contact', 'FacebookLikes', 'TwitterFollowers']])
-testNonSparseFeats = sparse.csr_matrix(test[['Contact', 'FacebookLikes', 'TwitterFollowers']])
-
-# Concatenate all sparse matrices
-trainM = sparse.hstack([trainNonSparseFeats, trainTOBSparseM, trainAreaCodeSparseM, trainExtensionSparseM])
-testM = sparse.hstack([testNonSparseFeats, testTOBSparseM, testAreaCodeSparseM, testExtensionSparseM])
-
-# Convert to type DMatrix for xgboost
-trainM = xgb.DMatrix(data=trainM, label=train.Sale)
-testM = xgb.DMatrix(data=testM, label=test.Sale)
+# Build the model matrices
+#
+# LeadFeaturizer (see lead_features.py) learns its category lookups from train and then transforms train and test
+# the same way:
+# - TypeOfBusiness: NaN becomes "NA_Val", then one-hot-encode every business type seen in train (min_tob_count=1)
+# - AreaCode: one-hot-encode the area code, which LEADS parses from PhoneNumber as an integer (an AreaCode not seen in train gets all 0s)
+# - WebsiteExtension: bucket Website by its top-level domain into none, com, org, net or other and one-hot-encode
+# - Contact: convert to numeric, ordered general line < other < manager < owner
+# - FacebookLikes, TwitterFollowers: left as is, NaNs included (na_fill=None)
+
+# The fitted featurizer, the sparse matrices and the booster are cached on disk (see mlpb/cache.py), keyed by the data,
+# the feature code (lead_features.py, and mlpb/schema.py which parses the data) and the parameters, so re-running the
+# script with unchanged inputs skips straight to prediction
+cache = ArtifactCache()
+
+featurizer_params = {'blocks': ['Contact', 'FacebookLikes', 'TwitterFollowers', 'TOB', 'AC', 'EX'], 'min_tob_count': 1, 'na_fill': None}
+featurizer_key = cache.key(data=["_Data/train.csv"], code=[lead_features, schema], params=featurizer_params)
+featurizer, _ = cache.get_or_create(featurizer_key, lambda: LeadFeaturizer(**featurizer_params).fit(train))
+
+# Build the sparse matrices directly from the category codes (no dense intermediate or per-feature sparse matrices).
+# DMatrix objects can't be pickled, so the CSR matrices are cached and converted to DMatrix where they're used
+trainM_key = cache.key(data=["_Data/train.csv"], params={'featurizer': featurizer_key})
+trainM, _ = cache.get_or_create(trainM_key, lambda: featurizer.transform_sparse(train))
+testM_key = cache.key(data=["_Data/test.csv"], params={'featurizer': featurizer_key})
+testM, _ = cache.get_or_create(testM_key, lambda: featurizer.transform_sparse(test))
 
 #======================================================================================================
 # XGBoost Model
 
+profiler.mark("XGBoost Model", rows=train.shape[0])
 np.random.seed(2016)  # eta=.3, max.depth=10, subsample=.75, colsample_bytree=.75, min_child_weight=1, gamma=0, lambda=0, alpha=0
 boosting_params = {'bst:eta':0.3, 'bst:max_depth':10, 'bst:subsample':.75, 'bst:colsample_bytree':.75, 'min_child_weight':1, 'gamma':0, 'lambda':0, 'alpha':0, 'objective':'binary:logistic', 'eval_metric':'auc'}
-bst = xgb.train(params=boosting_params, dtrain=trainM, num_boost_round=10)
+bst_key = cache.key(params={'featurizer': featurizer_key, 'boosting_params': boosting_params, 'num_boost_round': 10})
+
+# Convert the training matrix to type DMatrix for xgboost (only needed when the booster isn't cached)
+def train_booster():
+    dtrain = xgb.DMatrix(data=trainM, label=train.Sale, feature_names=featurizer.feature_names_)
+    return xgb.train(params=boosting_params, dtrain=dtrain, num_boost_round=10)
+
+bst, bst_cached = cache.get_or_create(bst_key, train_booster)
 
 #======================================================================================================
 # Make some predictions on the test set & evaluate the results
 
-test['ProbSale'] = bst.predict(testM)
+profiler.mark("Make some predictions on the test set & evaluate the results", rows=test.shape[0])
+test['ProbSale'] = bst.predict(xgb.DMatrix(data=testM, feature_names=featurizer.feature_names_))
 
 #--------------------------------------------------
 # Rank the predictions from most likely to least likely
@@ -166,3 +126,5 @@ test[['ProbSaleRk', 'CompanyName', 'ProbSale', 'Sale']]  # Looks perty good!
 # Evaluate the results using area under the ROC curve
 
 roc_auc_score(y_true=test.Sale, y_score=test.ProbSale)  # 0.875
+
+profiler.finish()
@@ -0,0 +1,82 @@
+# Gradient Boosting model using XGBoost, trained from external memory
+
+# Notes about this model:
+# Same features as rank_leads_xgb.py, but built for a lead history that doesn't fit in memory (see lead_boosting.py).
+# The training leads are featurized chunk by chunk into CSR blocks on disk, and xgboost trains from them with histogram
+# tree building, keeping its own page cache on disk. Instead of a fixed 10 rounds, training stops when the AUC of a
+# held-out 20% of the training leads stops improving, and the time and memory of every round are recorded.
+# With only 20 training leads the eval set is tiny, so the chunksize here is just small enough to show several blocks.
+
+# Imports
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+from lead_features import LeadFeaturizer
+from lead_boosting import train_external, write_lead_blocks
+
+from mlpb.profiling import Profiler
+from mlpb.schema import LEADS
+
+# # Set working directory
+# os.chdir("/Path/To/Rank Sales Leads")
+
+# Stage timing and memory, off unless MLPB_PROFILE is set (see mlpb/profiling.py)
+profiler = Profiler.from_env("rank_leads_xgb_external")
+
+#======================================================================================================
+# Load Data (Assumes your current working directory is the Rank Sales Leads problem directory)
+
+profiler.mark("Load Data")
+
+# Only the training leads' categories are needed in memory to fit the featurizer. The leads themselves are streamed
+train = LEADS.read("_Data/train.csv", columns=['TypeOfBusiness', 'AreaCode', 'Website'])
+test = LEADS.read("_Data/test.csv")
+
+#======================================================================================================
+# Featurize the training leads into blocks on disk
+
+profiler.mark("Featurize the training leads into blocks on disk")
+featurizer = LeadFeaturizer(blocks=['Contact', 'FacebookLikes', 'TwitterFollowers', 'TOB', 'AC', 'EX'], min_tob_count=1, na_fill=None)
+featurizer.fit(train)
+
+# The blocks and xgboost's page cache go to a temporary directory, deleted once the model is trained (or when Python exits,
+# if the script stops before that)
+block_dir = tempfile.TemporaryDirectory(prefix='lead_blocks_')
+blocks = write_lead_blocks("_Data/train.csv", featurizer, block_dir.name, chunksize=8, eval_fraction=.2)
+blocks
+
+#======================================================================================================
+# XGBoost Model
+
+profiler.mark("XGBoost Model", rows=train.shape[0])
+boosting_params = {'eta':0.3, 'max_depth':10, 'subsample':.75, 'colsample_bytree':.75, 'min_child_weight':1, 'gamma':0, 'lambda':0, 'alpha':0, 'objective':'binary:logistic', 'eval_metric':'auc', 'seed':2016}
+bst, rounds = train_external(blocks, featurizer.feature_names_, boosting_params, cache_dir=block_dir.name, num_boost_round=200, early_stopping_rounds=10)
+block_dir.cleanup()
+
+# Time, memory and eval AUC of each round
+rounds
+bst.num_boosted_rounds()
+
+#======================================================================================================
+# Make some predictions on the test set & evaluate the results
+
+profiler.mark("Make some predictions on the test set & evaluate the results", rows=test.shape[0])
+testM = xgb.DMatrix(data=featurizer.transform_sparse(test), feature_names=featurizer.feature_names_)
+test['ProbSale'] = bst.predict(testM)
+
+#--------------------------------------------------
+# Rank the predictions from most likely to least likely
+
+test.sort_values('ProbSale', inplace=True, ascending=False)
+test['ProbSaleRk'] = np.arange(test.shape[0])
+test[['ProbSaleRk', 'CompanyName', 'ProbSale', 'Sale']]
+
+#--------------------------------------------------
+# Evaluate the results using area under the ROC curve
+
+roc_auc_score(y_true=test.Sale, y_score=test.ProbSale)
+
+profiler.finish()
@@ -0,0 +1,8 @@
+# Shared Python helpers for the MLPB problems
+#
+# The problem scripts assume the working directory is their problem directory, so each problem puts the repository root
+# on the path once (in its script, or in the helper module its scripts import first) before importing from this package
+# (see "Shared Python helpers" in the README):
+#   import sys
+#   sys.path.append(os.path.join("..", ".."))
+#   from mlpb.metrics import StreamingAUC
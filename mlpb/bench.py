@@ -0,0 +1,187 @@
+# Benchmarks for the Python problem scripts
+
+# Notes about this module:
+# Each benchmark runs one of the problem scripts itself on a synthetic dataset from mlpb.datagen, so what is timed is
+# exactly the code a user runs. The script runs in a fresh interpreter, in a mirror of the repository layout whose problem
+# directory links to the real script, its helper modules and mlpb, but whose _Data is the synthetic dataset. Profiling is
+# switched on (MLPB_PROFILE=1, see mlpb/profiling.py), so the stages are the script's own #===== banners, each with its
+# wall time, CPU time, peak allocation, peak RSS and rows/sec. The artifact cache points at an empty directory for each
+# run, so the models are always fitted. Every run is appended to a JSON history file, so a change can be compared
+# against earlier runs at the same size.
+#
+# Scripts with settings sized for the tiny demo files get realistic ones through the environment: the job titles
+# hashing model trains in batches of MLPB_BATCH_SIZE=100000 titles. naive_bayes_model.py fits its CountVectorizer on the
+# whole corpus, but its Naive Bayes models only ever see the first ten titles, so at scale it measures the vocabulary
+# fit. rank_leads_xgb_external.py is left out: it writes blocks of 8 leads (chunksize=8, for the 20-lead demo file), so
+# at scale it would measure per-block overhead.
+#
+# Datasets are generated once per (problem, rows, seed) and reused; they and the history live in $MLPB_BENCH_DIR
+# (default ~/.cache/mlpb-bench).
+#
+# Usage (from the repository root):
+#   python -m mlpb.bench --rows 1e3 1e5 --pipelines leads_rf leads_xgb
+#   python -m mlpb.bench --rows 1e6 --compare   # print each stage against the previous run of the same pipeline/rows
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+
+from mlpb import datagen
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBLEMS_DIR = os.path.join(REPO_ROOT, 'Problems')
+
+# Synthetic datasets and the run history are kept out of the repository
+BENCH_ROOT = os.environ.get('MLPB_BENCH_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mlpb-bench'))
+
+# pipeline name: (datagen problem, problem directory, script, extra environment variables)
+PIPELINES = {
+    'leads_rf': ('leads', 'Rank Sales Leads', 'rank_leads_rf1.py', {}),
+    'leads_xgb': ('leads', 'Rank Sales Leads', 'rank_leads_xgb.py', {}),
+    'leads_logreg': ('leads', 'Rank Sales Leads', 'rank_leads_logreg.py', {}),
+    'nfl_rf': ('nfl', 'Predict NFL Game Winner', 'random_forest_model.py', {}),
+    'income_xgb': ('income', 'Predict Income', 'predict_income_xgb3.py', {}),
+    'titles_nb': ('job_titles', 'Classify Job Titles', 'naive_bayes_model.py', {}),
+    'titles_nb_hashing': ('job_titles', 'Classify Job Titles', 'naive_bayes_hashing_model.py',
+                          {'MLPB_BATCH_SIZE': '100000'})
+}
+
+# Stage fields kept in the history
+STAGE_FIELDS = ['stage', 'rows', 'wall_sec', 'cpu_sec', 'peak_alloc_mb', 'peak_rss_mb', 'rows_per_sec']
+
+#======================================================================================================
+# Runs
+
+
+def _mirror(problem_dir, data_dir, run_dir):
+    # Repository layout in run_dir with links to the real code and data_dir as the problem's _Data. The scripts put
+    # ../.. on sys.path, which here is run_dir, where mlpb links to the real package
+    os.symlink(os.path.join(REPO_ROOT, 'mlpb'), os.path.join(run_dir, 'mlpb'))
+    source = os.path.join(PROBLEMS_DIR, problem_dir)
+    work = os.path.join(run_dir, 'Problems', problem_dir)
+    os.makedirs(work)
+    for name in os.listdir(source):
+        if name.endswith('.py'):
+            os.symlink(os.path.join(source, name), os.path.join(work, name))
+    os.symlink(os.path.abspath(data_dir), os.path.join(work, '_Data'))
+    return work
+
+
+def run_script(problem_dir, script, data_dir, env=None):
+    """
+    Run a problem script on the data in data_dir with profiling on. Returns (its Profiler stages, the wall time of the
+    whole process including interpreter start up and imports)
+
+    env: extra environment variables for the script
+    """
+    with tempfile.TemporaryDirectory(prefix='mlpb-bench-') as run_dir:
+        work = _mirror(problem_dir, data_dir, run_dir)
+        profile_dir = os.path.join(run_dir, 'profile')
+        env = dict(os.environ, **(env or {}))
+        env.update(MLPB_PROFILE='1', MLPB_PROFILE_DIR=profile_dir, MLPB_CACHE_DIR=os.path.join(run_dir, 'cache'))
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, script], cwd=work, env=env, capture_output=True, text=True)
+        process_sec = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError("{} failed on {}:\n{}".format(script, data_dir, result.stderr[-4000:]))
+        reports = glob.glob(os.path.join(profile_dir, '*.profile.json'))
+        if len(reports) != 1:
+            raise RuntimeError("{} wrote {} profile reports, expected 1".format(script, len(reports)))
+        with open(reports[0]) as f:
+            stages = json.load(f)['stages']
+    return [{k: s.get(k) for k in STAGE_FIELDS} for s in stages], process_sec
+
+
+def run(pipeline, rows, data_root, seed=2016):
+    """Run one pipeline's script on a synthetic dataset of `rows` rows (generated into data_root on first use)."""
+    problem, problem_dir, script, env = PIPELINES[pipeline]
+    data_dir = os.path.join(data_root, '{}_{}_{}'.format(problem, rows, seed))
+    if not all(os.path.exists(path) for path in datagen.dataset_paths(problem, data_dir)):
+        datagen.write_dataset(problem, rows, data_dir, seed=seed)
+    stages, process_sec = run_script(problem_dir, script, data_dir, env=env)
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'pipeline': pipeline,
+        'script': os.path.join(problem_dir, script),
+        'rows': rows,
+        'total_wall_sec': sum(s['wall_sec'] for s in stages),
+        'process_wall_sec': process_sec,
+        'stages': stages
+    }
+
+#======================================================================================================
+# History
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path, record):
+    history = load_history(path)
+    history.append(record)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp, path)
+
+
+def previous_run(history, pipeline, rows):
+    """The latest run in history of the given pipeline and size (None if there isn't one)."""
+    runs = [r for r in history if r['pipeline'] == pipeline and r['rows'] == rows]
+    return runs[-1] if runs else None
+
+
+def format_run(record, previous=None):
+    """Table of a run's stages (with wall time relative to `previous`, if given)."""
+    table = pd.DataFrame(record['stages']).set_index('stage')
+    if previous is not None:
+        before = pd.DataFrame(previous['stages']).set_index('stage').wall_sec
+        table['vs_previous'] = table.wall_sec / before.reindex(table.index)
+    title = "{pipeline} ({script}) rows={rows} stages={total_wall_sec:.3f}s process={process_wall_sec:.3f}s".format(**record)
+    return title + '\n' + table.to_string(float_format=lambda x: '{:,.3f}'.format(x))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MLPB Python problem scripts on synthetic data")
+    parser.add_argument('--pipelines', nargs='+', choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    parser.add_argument('--rows', nargs='+', type=float, default=[1e3, 1e4, 1e5], help="dataset sizes, e.g. 1e3 1e6")
+    parser.add_argument('--data-root', default=os.path.join(BENCH_ROOT, 'data'),
+                        help="where the synthetic datasets are generated and reused")
+    parser.add_argument('--history', default=os.path.join(BENCH_ROOT, 'history.json'))
+    parser.add_argument('--compare', action='store_true', help="compare each run against the previous one in history")
+    parser.add_argument('--seed', type=int, default=2016)
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        for pipeline in args.pipelines:
+            previous = previous_run(load_history(args.history), pipeline, int(rows)) if args.compare else None
+            record = run(pipeline, int(rows), args.data_root, seed=args.seed)
+            append_history(args.history, record)
+            print(format_run(record, previous) + '\n')
+
+
+if __name__ == '__main__':
+    main()
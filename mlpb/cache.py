@@ -0,0 +1,178 @@
+# On-disk cache of fitted encoders, matrices and models
+
+# Notes about this module:
+# Most runs of a problem script use the same training data, feature code and hyperparameters as the last run, so refitting
+# the encoders and the model is wasted work. ArtifactCache stores any picklable object (a fitted LeadFeaturizer, a CSR
+# matrix, a RandomForestClassifier, an xgboost Booster, ...) under a key that is a hash of
+# - data: the contents of the training files (or DataFrames/arrays)
+# - code: the source of the modules that build the features, so editing them invalidates the cache
+# - params: the hyperparameters
+# plus the Python version and the installed versions of the numeric libraries, since pickles are tied to them. The
+# versions are read from the package metadata, so a key doesn't depend on which libraries happen to be imported yet.
+# Entries live in one directory on local disk. Reading an entry marks it as recently used, and whenever the directory
+# grows past max_bytes the least recently used entries are deleted.
+#
+# Usage:
+#   cache = ArtifactCache()  # ~/.cache/mlpb, or $MLPB_CACHE_DIR
+#   key = cache.key(data=["_Data/train.csv"], code=[lead_features], params={'n_estimators': 200})
+#   rf, hit = cache.get_or_create(key, lambda: RandomForestClassifier(n_estimators=200).fit(X, y))
+
+import hashlib
+import importlib.metadata
+import inspect
+import json
+import os
+import pickle
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Distributions whose installed version is part of every key (None if not installed)
+VERSIONED_LIBRARIES = ['numpy', 'pandas', 'scipy', 'scikit-learn', 'xgboost']
+
+DEFAULT_ROOT = os.environ.get('MLPB_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mlpb'))
+
+#======================================================================================================
+# Hashing
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """sha256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_data(data):
+    """sha256 of a file (given its path), DataFrame, Series or numpy array."""
+    if isinstance(data, (str, os.PathLike)):
+        return hash_file(data)
+    h = hashlib.sha256()
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        if isinstance(data, pd.DataFrame):
+            h.update(json.dumps([str(c) for c in data.columns]).encode())
+    else:
+        data = np.ascontiguousarray(data)
+        h.update(json.dumps([data.dtype.str, data.shape]).encode())
+        h.update(data.tobytes())
+    return h.hexdigest()
+
+
+def hash_code(code):
+    """sha256 of the source of a module, class or function (or of a source file, given its path)."""
+    if isinstance(code, (str, os.PathLike)):
+        return hash_file(code)
+    return hashlib.sha256(inspect.getsource(code).encode()).hexdigest()
+
+
+def library_versions(names=VERSIONED_LIBRARIES):
+    """{distribution: installed version or None}, from the package metadata (nothing is imported)."""
+    versions = {}
+    for name in names:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+#======================================================================================================
+# Cache
+
+
+class ArtifactCache(object):
+    """
+    Content-addressed, size-bounded cache of pickled objects on local disk
+
+    root: cache directory (created if needed)
+    max_bytes: total size of the entries to keep. The least recently used entries are evicted beyond it
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=2 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.versions = library_versions()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, data=(), code=(), params=None):
+        """Cache key for artifacts built from `data` by `code` with hyperparameters `params` (JSON serializable)."""
+        parts = {
+            'data': [hash_data(d) for d in data],
+            'code': [hash_code(c) for c in code],
+            'params': params,
+            'python': sys.version,
+            'versions': self.versions
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key, default=None):
+        """The object stored under key, or default if there is none."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        os.utime(path)  # mark as recently used
+        return obj
+
+    def put(self, key, obj):
+        """Store obj under key, then evict least recently used entries if the cache is over max_bytes."""
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict(keep=key)
+
+    def get_or_create(self, key, create):
+        """Return (object, True) if key is cached, otherwise (create(), False) after storing it."""
+        obj = self.get(key, default=_missing)
+        if obj is not _missing:
+            return obj, True
+        obj = create()
+        self.put(key, obj)
+        return obj, False
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits in max_bytes (never deleting `keep`)."""
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == '{}.pkl'.format(keep):
+                continue
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass  # evicted by another process
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.root, name))
+
+
+_missing = object()
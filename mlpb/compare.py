@@ -0,0 +1,122 @@
+# Train and compare several models on one shared feature matrix
+
+# Notes about this module:
+# Comparing candidate models used to mean re-running a whole script per model (or refitting inside one script), which
+# reloads and refeaturizes the data every time. compare_models() takes the featurized train and test matrices once,
+# copies them into shared memory (see mlpb.cv.SharedArrays) and fits every model configuration as a separate task on
+# a process pool. Workers attach to the shared arrays read-only, so tasks only send a model class and its parameters.
+# Each task reports the test accuracy and log loss, and the wall time and rows/sec of fit and predict_proba, and
+# compare_models() puts them in one table.
+# Models run concurrently, so give multi-threaded models (RandomForestClassifier, XGBClassifier) n_jobs=1 unless there
+# are more CPUs than models. As with mlpb.cv.grid_search, on platforms that start workers with spawn (Windows, macOS),
+# call compare_models from a script guarded by if __name__ == "__main__", or pass n_jobs=1.
+#
+# Usage:
+#   configs = [
+#       ('rf', RandomForestClassifier, {'n_estimators': 200, 'n_jobs': 1}),
+#       ('xgb', XGBClassifier, {'objective': 'multi:softprob', 'max_depth': 2, 'n_jobs': 1}),
+#       ('logreg', LogisticRegression, {'max_iter': 1000}),
+#       ('nb', GaussianNB, {})
+#   ]
+#   results = compare_models(configs, train_X, train.Species, test_X, test.Species)
+#   results.scores  # one row per model: Accuracy, LogLoss, fit and predict seconds and rows/sec
+#   results.probs['xgb']  # test probabilities of a model, columns in results.classes order
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from mlpb.cv import SharedArrays, attach_arrays, attach_shared, detach_arrays, shared_array
+
+
+def log_loss(y_true, probs, eps=1e-15):
+    """Mean negative log probability of the true class (y_true: class indices into the columns of probs)."""
+    p = np.clip(probs[np.arange(len(y_true)), y_true], eps, 1)
+    return float(-np.mean(np.log(p)))
+
+
+def _fit_score(name, model_fn, params):
+    # Runs in a worker: fit on the shared train matrix, score the shared test matrix
+    X_train, y_train, X_test, y_test = [shared_array(name) for name in ('X_train', 'y_train', 'X_test', 'y_test')]
+    model = model_fn(**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw = model.predict_proba(X_test)
+    predict_sec = time.perf_counter() - start
+
+    # Align the columns with the full set of classes in case a class is missing from the training data
+    probs = np.zeros((raw.shape[0], shared_array('n_classes').item()))
+    probs[:, np.asarray(model.classes_, dtype=np.int64)] = raw
+    score = {
+        'Model': name,
+        'Accuracy': float(np.mean(np.argmax(probs, axis=1) == y_test)),
+        'LogLoss': log_loss(y_test, probs),
+        'FitSec': fit_sec,
+        'FitRowsPerSec': X_train.shape[0] / fit_sec if fit_sec > 0 else None,
+        'PredictSec': predict_sec,
+        'PredictRowsPerSec': X_test.shape[0] / predict_sec if predict_sec > 0 else None
+    }
+    return score, probs
+
+
+class ComparisonResult(object):
+    """
+    Output of compare_models()
+
+    scores: DataFrame with one row per model (in config order)
+    probs: {model name: test probabilities, shape (n_test, n_classes)}
+    classes: class labels (the columns of every probs array)
+    """
+
+    def __init__(self, scores, probs, classes):
+        self.scores = scores
+        self.probs = probs
+        self.classes = classes
+
+    @property
+    def best(self):
+        """Name of the model with the lowest test log loss."""
+        return self.scores.Model.values[int(np.argmin(self.scores.LogLoss.values))]
+
+
+def compare_models(configs, X_train, y_train, X_test, y_test, n_jobs=None):
+    """
+    Fit every model configuration on the same training data and score it on the same test data
+
+    configs: list of (name, model_fn, params). model_fn(**params) must return an unfitted classifier with fit and
+      predict_proba, and must be picklable (a class, a module level function or functools.partial). Labels are passed
+      to fit as class indices 0, 1, ... (as XGBClassifier requires)
+    n_jobs: number of worker processes (default: min(number of CPUs, number of configs)). 1 runs every model here
+    """
+    names = [name for name, _, _ in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Model names must be unique (got {})".format(names))
+    classes, codes = np.unique(np.concatenate([np.asarray(y_train), np.asarray(y_test)]), return_inverse=True)
+    arrays = {
+        'X_train': np.asarray(X_train, dtype=np.float64),
+        'y_train': codes[:len(y_train)],
+        'X_test': np.asarray(X_test, dtype=np.float64),
+        'y_test': codes[len(y_train):],
+        'n_classes': np.array(len(classes))
+    }
+
+    n_jobs = n_jobs or min(os.cpu_count(), len(configs))
+    with SharedArrays(**arrays) as shared:
+        if n_jobs == 1:
+            attach_arrays(shared.arrays)
+            try:
+                results = [_fit_score(name, model_fn, params) for name, model_fn, params in configs]
+            finally:
+                detach_arrays()
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=attach_shared, initargs=(shared.spec(),)) as pool:
+                futures = [pool.submit(_fit_score, name, model_fn, params) for name, model_fn, params in configs]
+                results = [future.result() for future in futures]
+
+    scores = pd.DataFrame([score for score, _ in results])
+    probs = {name: p for name, (_, p) in zip(names, results)}
+    return ComparisonResult(scores, probs, classes)
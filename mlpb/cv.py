@@ -0,0 +1,226 @@
+# Parallel cross validation and grid search
+
+# Notes about this module:
+# This is the Python version of the cross validation loops in Classify Dart Throwers/classify_dart_throwers_stacking.R.
+# Stratified folds are built once, and every (parameter set, test fold) pair is fit and scored as a separate task on a
+# process pool. The training arrays are copied once into shared memory, which every worker attaches to when it starts,
+# so tasks only send parameters and fold ids to the workers instead of pickling X and y for every task.
+# Out-of-fold predictions are kept for every parameter set so the best ones can be used as meta features for stacking.
+# On platforms that start workers with spawn (Windows, macOS), call grid_search from a script guarded by
+# if __name__ == "__main__", or pass n_jobs=1.
+#
+# Usage:
+#   folds = stratified_folds(train.Competitor, nfolds=5, seed=2016)
+#   knnCV = grid_search(KNeighborsClassifier, {'n_neighbors': range(1, 31)}, X, train.Competitor, folds)
+#   knnCV.scores  # one row per parameter set: params, score per fold, mean Score
+#   knnCV.best_params, knnCV.best_oof  # best parameters and their out-of-fold predictions
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+#======================================================================================================
+# Folds and parameter grids
+
+
+def stratified_folds(y, nfolds=5, seed=None):
+    """Fold id (0, 1, ... nfolds-1) for each sample, with every class spread as evenly as possible over the folds."""
+    _, codes = np.unique(np.asarray(y), return_inverse=True)
+    rng = np.random.RandomState(seed)
+    folds = np.empty(len(codes), dtype=np.int64)
+    start = 0
+    for cls in range(codes.max() + 1):
+        idx = rng.permutation(np.flatnonzero(codes == cls))
+        folds[idx] = (start + np.arange(len(idx))) % nfolds
+        start += len(idx)  # so small classes don't all land in the first folds
+    return folds
+
+
+def expand_grid(param_grid):
+    """
+    List of parameter dicts from a dict of {name: values} (every combination, like data.table's CJ) or from a list of
+    such dicts
+    """
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+    params = []
+    for grid in param_grid:
+        names = list(grid.keys())
+        params.extend(dict(zip(names, values)) for values in itertools.product(*[list(grid[n]) for n in names]))
+    return params
+
+#======================================================================================================
+# Shared memory
+
+
+class SharedArrays(object):
+    """
+    Copies of numpy arrays in shared memory, created by the parent process
+
+    spec() describes the blocks so workers can attach to them with attach_shared(); close() frees them.
+    """
+
+    def __init__(self, **arrays):
+        self._blocks = {}
+        self.arrays = {}
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            self._blocks[name] = (shm, arr.shape, arr.dtype.str)
+            self.arrays[name] = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+            self.arrays[name][...] = arr
+
+    def spec(self):
+        return {name: (shm.name, shape, dtype) for name, (shm, shape, dtype) in self._blocks.items()}
+
+    def close(self):
+        self.arrays = {}
+        for shm, _, _ in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Arrays attached by the current worker process (name -> ndarray), and the SharedMemory handles keeping them alive
+_shared = {}
+_shared_handles = []
+
+
+def attach_shared(spec):
+    """Pool initializer: map the parent's shared arrays into this process as read-only ndarrays."""
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared_handles.append(shm)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        _shared[name] = arr
+
+
+def attach_arrays(arrays):
+    """Attach arrays (name -> ndarray) in this process, to run tasks without a pool. Undo with detach_arrays()."""
+    _shared.update(arrays)
+
+
+def detach_arrays():
+    """Forget the arrays attached with attach_arrays()."""
+    _shared.clear()
+
+
+def shared_array(name):
+    """An array attached in this process, by attach_shared() in a worker or attach_arrays()."""
+    return _shared[name]
+
+#======================================================================================================
+# Grid search
+
+
+class GridSearchResult(object):
+    """
+    Output of grid_search()
+
+    scores: DataFrame with one row per parameter set (parameters, Fold0..FoldK scores and their mean, Score)
+    oof: out-of-fold predictions for every parameter set, shape (n_params, n_samples) for method='predict' and
+      (n_params, n_samples, n_classes) for method='predict_proba'
+    classes: class labels (the columns of predict_proba, and the values of predict)
+    """
+
+    def __init__(self, params, fold_scores, oof, classes):
+        self.params = params
+        self.classes = classes
+        self.oof = oof
+        self.scores = pd.DataFrame(params)
+        for fold in range(fold_scores.shape[1]):
+            self.scores['Fold{}'.format(fold)] = fold_scores[:, fold]
+        self.scores['Score'] = fold_scores.mean(axis=1)
+        self.best_index = int(np.argmax(self.scores.Score.values))
+
+    @property
+    def best_params(self):
+        return self.params[self.best_index]
+
+    @property
+    def best_score(self):
+        return self.scores.Score.values[self.best_index]
+
+    @property
+    def best_oof(self):
+        return self.oof[self.best_index]
+
+
+def accuracy(y_true, y_pred):
+    return np.mean(y_true == y_pred)
+
+
+def _fit_predict(model_fn, params, fold, method, scoring):
+    # Runs in a worker: fit on every fold but `fold`, predict `fold`
+    X, y, folds = _shared['X'], _shared['y'], _shared['folds']
+    test = folds == fold
+    model = model_fn(**params)
+    model.fit(X[~test], y[~test])
+    if method == 'predict_proba':
+        probs = model.predict_proba(X[test])
+
+        # Align the columns with the full set of classes in case a class is missing from the training folds
+        preds = np.zeros((probs.shape[0], _shared['n_classes'].item()))
+        preds[:, model.classes_] = probs
+        score = scoring(y[test], np.argmax(preds, axis=1))
+    else:
+        preds = model.predict(X[test])
+        score = scoring(y[test], preds)
+    return preds, score
+
+
+def grid_search(model_fn, param_grid, X, y, folds, scoring=accuracy, method='predict', n_jobs=None):
+    """
+    Cross validate a model for every parameter set in a grid
+
+    model_fn: callable returning an unfitted scikit-learn style model from keyword parameters (e.g. the model class).
+      Must be picklable, so use a class, a module level function or functools.partial
+    param_grid: dict of {name: values} or a list of them (see expand_grid)
+    folds: fold id for each sample (see stratified_folds)
+    scoring: callable(y_true, y_pred) -> float where higher is better. Labels are passed as class indices
+    method: 'predict' or 'predict_proba' (which out-of-fold predictions to keep)
+    n_jobs: number of worker processes (default: number of CPUs). Use 1 to run everything in this process
+    """
+    params = expand_grid(param_grid)
+    classes, y_codes = np.unique(np.asarray(y), return_inverse=True)
+    X = np.asarray(X)
+    folds = np.asarray(folds)
+    fold_ids = np.unique(folds)
+    tasks = [(i, f) for i in range(len(params)) for f in range(len(fold_ids))]
+
+    n_jobs = n_jobs or os.cpu_count()
+    arrays = {'X': X, 'y': y_codes, 'folds': folds, 'n_classes': np.array(len(classes))}
+    with SharedArrays(**arrays) as shared:
+        if n_jobs == 1:
+            attach_arrays(shared.arrays)
+            try:
+                results = [_fit_predict(model_fn, params[i], fold_ids[f], method, scoring) for i, f in tasks]
+            finally:
+                detach_arrays()
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=attach_shared, initargs=(shared.spec(),)) as pool:
+                futures = [pool.submit(_fit_predict, model_fn, params[i], fold_ids[f], method, scoring) for i, f in tasks]
+                results = [future.result() for future in futures]
+
+    # Assemble the out-of-fold predictions and the score for each (parameter set, fold)
+    fold_scores = np.empty((len(params), len(fold_ids)))
+    if method == 'predict_proba':
+        oof = np.empty((len(params), len(y_codes), len(classes)))
+    else:
+        oof = np.empty((len(params), len(y_codes)), dtype=classes.dtype)
+    for (i, f), (preds, score) in zip(tasks, results):
+        test = folds == fold_ids[f]
+        oof[i, test] = preds if method == 'predict_proba' else classes[preds]
+        fold_scores[i, f] = score
+
+    return GridSearchResult(params, fold_scores, oof, classes)
@@ -0,0 +1,221 @@
+# Synthetic datasets with the same schema as the problems' _Data files, at any size
+
+# Notes about this module:
+# The _Data files are tiny (21 training leads, 7 NFL games), which says nothing about how a pipeline behaves at
+# production scale. Each generator here returns a chunk of rows with exactly the columns and value formats of a problem's
+# train.csv, with the labels depending on the features so the models have something to learn. The category tables
+# (business types, area codes, cities...) grow with the number of rows, and they are drawn from the seed alone so every
+# chunk of a dataset shares them. write_dataset() streams chunks to train.csv and test.csv (or, for a problem whose
+# scripts read a single file, such as Classify Job Titles' jobtitles.csv, to that file), so even 10^8 rows never have
+# to fit in memory.
+#
+# Usage:
+#   python -m mlpb.datagen leads 1000000 /tmp/leads_1e6   # writes /tmp/leads_1e6/train.csv and test.csv
+#   write_dataset('income', 10**5, '/tmp/income_1e5')
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+CONTACTS = ["general line", "other", "manager", "owner"]
+TLDS = ['com', 'org', 'net', 'us', 'co', 'biz', 'info']
+TLD_WEIGHTS = [.6, .12, .12, .06, .04, .03, .03]
+NFL_TEAMS = ['Falcons', 'Cowgirls', 'Eagles', 'Bucs', 'Panthers', 'Bears', 'Packers', 'Lions', 'Vikings', 'Giants',
+             'Redskins', 'Cardinals', 'Rams', '49ers', 'Seahawks', 'Patriots', 'Jets', 'Bills', 'Dolphins', 'Steelers',
+             'Ravens', 'Browns', 'Bengals', 'Texans', 'Colts', 'Jaguars', 'Titans', 'Broncos', 'Chiefs', 'Raiders',
+             'Chargers']
+JOB_WORDS = {
+    'finance': ['underwriter', 'mortgage', 'accountant', 'auditor', 'loan', 'tax', 'treasury', 'credit', 'actuary'],
+    'sales': ['sales', 'account', 'retail', 'medical', 'territory', 'inside', 'channel', 'business development'],
+    'technology': ['data', 'software', 'developer', 'engineer', 'systems', 'network', 'devops', 'database']
+}
+JOB_LEVELS = ['', 'junior', 'senior', 'lead', 'principal', 'associate']
+JOB_ROLES = ['analyst', 'manager', 'associate', 'specialist', 'director', 'representative', 'consultant']
+
+
+def _logistic(x):
+    return 1 / (1 + np.exp(-x))
+
+#======================================================================================================
+# Generators
+#
+# Each takes (n, rng, tables, start) and returns a DataFrame of n rows whose ids start at `start`. tables comes from the
+# matching *_tables(n_total, rng) function and holds everything shared between chunks
+
+
+def leads_tables(n_total, rng):
+    n_tob = max(8, int(np.sqrt(n_total)))
+    n_ac = max(3, min(800, n_total // 10))
+    return {
+        'tob': np.array(['business type {}'.format(i) for i in range(n_tob)], dtype=object),
+        'tob_p': rng.zipf(1.5, size=n_tob).astype(float),  # a few common business types, many rare ones
+        'tob_effect': rng.normal(0, 1, size=n_tob),
+        'area_codes': rng.choice(np.arange(200, 1000), size=n_ac, replace=False),
+        'ac_effect': rng.normal(0, .5, size=n_ac)
+    }
+
+
+def leads(n, rng, tables, start=0):
+    tob_p = tables['tob_p'] / tables['tob_p'].sum()
+    tob = rng.choice(len(tob_p), size=n, p=tob_p)
+    ac = rng.integers(0, len(tables['area_codes']), size=n)
+    contact = rng.integers(0, len(CONTACTS), size=n)
+    likes = np.where(rng.random(n) < .4, np.nan, rng.geometric(1 / 60, size=n))
+    followers = np.where(rng.random(n) < .5, np.nan, rng.geometric(1 / 25, size=n))
+    has_site = rng.random(n) < .5
+    tld = rng.choice(TLDS, size=n, p=TLD_WEIGHTS)
+    ids = np.arange(start, start + n)
+
+    score = (tables['tob_effect'][tob] + tables['ac_effect'][ac] + .6 * contact + .8 * ~np.isnan(likes) +
+             .5 * has_site * (tld == 'com') - 2.5)
+    tob_names = tables['tob'][tob]
+    tob_names[rng.random(n) < .05] = np.nan
+
+    return pd.DataFrame({
+        'LeadID': ids,
+        'CompanyName': pd.Series(ids).map('Company {}'.format).values,
+        'TypeOfBusiness': tob_names,
+        'FacebookLikes': likes,
+        'TwitterFollowers': followers,
+        'Website': np.where(has_site, pd.Series(ids).map('company{}.'.format).values + tld, None),
+        'PhoneNumber': (tables['area_codes'][ac] * 10**7 + rng.integers(0, 10**7, size=n)).astype(str),
+        'Contact': np.array(CONTACTS, dtype=object)[contact],
+        'Sale': rng.random(n) < _logistic(score)
+    })
+
+
+def nfl_tables(n_total, rng):
+    return {'team_strength': rng.normal(0, 1, size=len(NFL_TEAMS))}
+
+
+def nfl(n, rng, tables, start=0):
+    team = rng.integers(0, len(NFL_TEAMS), size=n)
+    opp_rk = rng.integers(1, 33, size=n)
+    home = rng.random(n) < .5
+    score = .05 * (opp_rk - 16.5) + .5 * home - .5 * tables['team_strength'][team]
+    expert_noise = rng.normal(0, 1, size=(2, n))
+    return pd.DataFrame({
+        'Opponent': np.array(NFL_TEAMS, dtype=object)[team],
+        'OppRk': opp_rk,
+        'SaintsAtHome': home,
+        'Expert1PredWin': score + expert_noise[0] > 0,
+        'Expert2PredWin': score + expert_noise[1] > 0,
+        'SaintsWon': rng.random(n) < _logistic(score)
+    })
+
+
+def job_titles_tables(n_total, rng):
+    return {'categories': np.array(sorted(JOB_WORDS))}
+
+
+def job_titles(n, rng, tables, start=0):
+    categories = tables['categories']
+    category = rng.integers(0, len(categories), size=n)
+    # Each title mixes in a word from another category now and then, so the classes overlap
+    other = np.where(rng.random(n) < .15, rng.integers(0, len(categories), size=n), category)
+    words = [np.array(JOB_WORDS[c], dtype=object) for c in categories]
+    domain = np.empty(n, dtype=object)
+    for c in range(len(categories)):
+        mask = other == c
+        domain[mask] = words[c][rng.integers(0, len(words[c]), size=mask.sum())]
+    level = np.array(JOB_LEVELS, dtype=object)[rng.integers(0, len(JOB_LEVELS), size=n)]
+    role = np.array(JOB_ROLES, dtype=object)[rng.integers(0, len(JOB_ROLES), size=n)]
+    title = pd.Series(level + ' ' + domain + ' ' + role).str.strip()
+    return pd.DataFrame({'job_title': title.values, 'job_category': categories[category]})
+
+
+def income_tables(n_total, rng):
+    # City < Region < Country, like Predict Income/_Data/data_generation.R: roughly 4 people per city, 10 cities per
+    # region and 10 regions per country
+    n_cities = max(1, n_total // 4)
+    n_regions = max(1, n_cities // 10)
+    n_countries = max(1, n_regions // 10)
+    country_income = rng.normal(60000, 10000, size=n_countries)
+    region_country = np.sort(rng.integers(0, n_countries, size=n_regions))
+    region_income = rng.normal(country_income[region_country], 5000)
+    city_region = np.sort(rng.integers(0, n_regions, size=n_cities))
+    city_income = rng.normal(region_income[city_region], 5000)
+    return {'region_country': region_country, 'city_region': city_region, 'city_income': city_income,
+            'city_p': rng.zipf(2.0, size=n_cities).astype(float)}
+
+
+def income(n, rng, tables, start=0):
+    city_p = tables['city_p'] / tables['city_p'].sum()
+    city = rng.choice(len(city_p), size=n, p=city_p)
+    region = tables['city_region'][city]
+    return pd.DataFrame({
+        'ID': np.arange(start + 1, start + n + 1),
+        'CountryID': tables['region_country'][region] + 1,
+        'RegionID': region + 1,
+        'CityID': city + 1,
+        'Income': rng.normal(tables['city_income'][city], 10000)
+    })
+
+
+# problem name: (tables function, generator, columns dropped from test.csv to match the problem's test.csv)
+GENERATORS = {
+    'leads': (leads_tables, leads, []),
+    'nfl': (nfl_tables, nfl, ['SaintsWon']),
+    'job_titles': (job_titles_tables, job_titles, []),
+    'income': (income_tables, income, [])
+}
+
+# Problems whose scripts read one file instead of train.csv and test.csv (every row goes to that file)
+SINGLE_FILES = {'job_titles': 'jobtitles.csv'}
+
+#======================================================================================================
+# Writing datasets
+
+
+def generate(problem, n, seed=2016):
+    """All n rows of a synthetic dataset as one DataFrame (for sizes that fit in memory)."""
+    tables_fn, gen, _ = GENERATORS[problem]
+    rng = np.random.default_rng(seed)
+    return gen(n, rng, tables_fn(n, rng))
+
+
+def dataset_paths(problem, out_dir):
+    """The files write_dataset() writes for a problem: [train.csv, test.csv], or [the problem's single file]."""
+    if problem in SINGLE_FILES:
+        return [os.path.join(out_dir, SINGLE_FILES[problem])]
+    return [os.path.join(out_dir, 'train.csv'), os.path.join(out_dir, 'test.csv')]
+
+
+def write_dataset(problem, n, out_dir, test_fraction=.25, seed=2016, chunk_rows=10**6):
+    """
+    Write n synthetic rows for a problem to out_dir/train.csv and out_dir/test.csv, chunk by chunk
+
+    Every row goes to test.csv with probability test_fraction, except for the problems in SINGLE_FILES, whose rows all
+    go to their one file. Returns the paths of the files (see dataset_paths).
+    """
+    tables_fn, gen, test_drop = GENERATORS[problem]
+    os.makedirs(out_dir, exist_ok=True)
+    paths = dataset_paths(problem, out_dir)
+    tables = tables_fn(n, np.random.default_rng(seed))
+
+    for start in range(0, n, chunk_rows):
+        rng = np.random.default_rng([seed, start])
+        chunk = gen(min(chunk_rows, n - start), rng, tables, start=start)
+        first = start == 0
+        if len(paths) == 1:
+            chunk.to_csv(paths[0], mode='w' if first else 'a', header=first, index=False)
+            continue
+        is_test = rng.random(chunk.shape[0]) < test_fraction
+        chunk[~is_test].to_csv(paths[0], mode='w' if first else 'a', header=first, index=False)
+        chunk[is_test].drop(columns=test_drop).to_csv(paths[1], mode='w' if first else 'a', header=first, index=False)
+
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset (train.csv and test.csv, or the problem's "
+                                                 "single file) for an MLPB problem")
+    parser.add_argument('problem', choices=sorted(GENERATORS))
+    parser.add_argument('rows', type=float, help="total number of rows, e.g. 1e6")
+    parser.add_argument('out_dir')
+    parser.add_argument('--test-fraction', type=float, default=.25)
+    parser.add_argument('--seed', type=int, default=2016)
+    args = parser.parse_args()
+    for path in write_dataset(args.problem, int(args.rows), args.out_dir, args.test_fraction, args.seed):
+        print(path)
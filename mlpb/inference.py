@@ -0,0 +1,122 @@
+# Block-wise, parallel predict_proba for fitted models
+
+# Notes about this module:
+# Calling predict_proba on a whole test matrix converts all of it (e.g. to float32 for a random forest) and builds each
+# tree's (rows x classes) output for every row at once, so memory grows with the batch. BlockPredictor instead scores
+# fixed-size blocks of rows and writes each block's probabilities into one preallocated output array, so the working
+# memory is bounded by block_size whatever the size of the batch, and blocks are scored concurrently:
+# - backend='thread' (default): a thread pool. scikit-learn's tree traversal releases the GIL, so forests scale across
+#   cores without copying the model or the data
+# - backend='process': a process pool. X is copied once into shared memory (see mlpb.cv.SharedArrays) and the model is
+#   sent once per worker, for models whose predict holds the GIL. Dense X only
+# dtype=np.float32 halves the size of the output.
+#
+# Usage:
+#   predictor = BlockPredictor(rf, block_size=10000, n_jobs=4)
+#   probs = predictor.predict_proba(test_X)  # same as rf.predict_proba(test_X)
+#   preds = predictor.predict(test_X)  # same as rf.predict(test_X)
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from mlpb.cv import SharedArrays, attach_shared, shared_array
+
+BACKENDS = ['thread', 'process']
+
+
+def _block(X, start, stop):
+    return X.iloc[start:stop] if isinstance(X, (pd.DataFrame, pd.Series)) else X[start:stop]
+
+#======================================================================================================
+# Process workers
+
+# The model scored by the current worker process
+_model = None
+
+
+def _init_worker(spec, model):
+    global _model
+    attach_shared(spec)
+    _model = model
+
+
+def _predict_shared_block(start, stop, columns):
+    # Runs in a worker: score rows start:stop of the shared X
+    X = shared_array('X')[start:stop]
+    if columns is not None:
+        X = pd.DataFrame(X, columns=columns)  # the model was fit on a DataFrame
+    return _model.predict_proba(X)
+
+#======================================================================================================
+# Predictor
+
+
+class BlockPredictor(object):
+    """
+    Scores a fitted classifier's predict_proba block by block on a pool of workers
+
+    block_size: rows per block
+    n_jobs: number of workers (default: number of CPUs). 1 scores the blocks one after another in this thread
+    backend: 'thread' or 'process'
+    dtype: dtype of the returned probabilities
+    """
+
+    def __init__(self, model, block_size=10000, n_jobs=None, backend='thread', dtype=np.float64):
+        if block_size < 1:
+            raise ValueError("block_size must be positive")
+        if backend not in BACKENDS:
+            raise ValueError("backend must be one of {}".format(BACKENDS))
+        self.model = model
+        self.block_size = block_size
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.backend = backend
+        self.dtype = dtype
+
+    def _blocks(self, n):
+        return [(start, min(start + self.block_size, n)) for start in range(0, n, self.block_size)]
+
+    def predict_proba(self, X, out=None):
+        """
+        Class probabilities for each row of X (columns in the order of model.classes_)
+
+        out: optional preallocated (rows x classes) array to fill and return
+        """
+        n = X.shape[0]
+        shape = (n, len(self.model.classes_))
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape:
+            raise ValueError("out has shape {}, expected {}".format(out.shape, shape))
+        blocks = self._blocks(n)
+
+        def score(block):
+            start, stop = block
+            out[start:stop] = self.model.predict_proba(_block(X, start, stop))
+
+        if self.n_jobs == 1 or len(blocks) <= 1:
+            for block in blocks:
+                score(block)
+        elif self.backend == 'thread':
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                list(pool.map(score, blocks))
+        else:
+            if not isinstance(X, (pd.DataFrame, np.ndarray)):
+                raise ValueError("backend='process' needs a dense array or DataFrame")
+            columns = None
+            if isinstance(X, pd.DataFrame):
+                columns = list(X.columns)
+                X = X.to_numpy(dtype=np.float64)  # one dtype for mixed int/bool/float frames
+            with SharedArrays(X=X) as shared:
+                with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                         initargs=(shared.spec(), self.model)) as pool:
+                    futures = [pool.submit(_predict_shared_block, start, stop, columns) for start, stop in blocks]
+                    for (start, stop), future in zip(blocks, futures):
+                        out[start:stop] = future.result()
+
+        return out
+
+    def predict(self, X):
+        """Most likely class of each row of X (like model.predict)."""
+        return self.model.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,110 @@
+# K-nearest neighbors for every k from a single tree query
+
+# Notes about this module:
+# Grid searching KNeighborsClassifier over k = 1..30 refits and re-queries the model 30 times per fold, although the
+# k nearest neighbors of a point are just the first k of its 30 nearest neighbors. MultiKNN builds one KD-tree
+# (scipy's cKDTree) per training set and asks it once for the max_k nearest neighbors of each query point, sorted by
+# distance. The prediction for every k then comes from that one neighbor list: the votes for each class are accumulated
+# one neighbor at a time (k = 1, 2, ...), so each k costs a vectorized add and argmax over the query points instead of a
+# new search. Votes are uniform and ties go to the first class in sorted order, as in KNeighborsClassifier.
+#
+# knn_grid_search is a drop-in replacement for mlpb.cv.grid_search(KNeighborsClassifier, {'n_neighbors': ks}, ...)
+# and returns the same GridSearchResult, so its out-of-fold predictions can be stacked the same way.
+#
+# Usage:
+#   knnCV = knn_grid_search(train[['XCoord', 'YCoord']].values, train.Competitor.values, folds, ks=range(1, 31))
+#   knnCV.best_params  # {'n_neighbors': k}
+#   knn = MultiKNN(max_k=30).fit(X, y)
+#   knn.predict_all(X_new)  # (n_samples, 30): column k-1 is the prediction using k neighbors
+
+import numpy as np
+from scipy.spatial import cKDTree
+from mlpb.cv import GridSearchResult, accuracy
+
+
+class MultiKNN(object):
+    """
+    K-nearest neighbors classifier that predicts with every k = 1..max_k at once
+
+    leafsize: cKDTree leaf size
+    n_jobs: threads for the neighbor query (None = one per CPU)
+    """
+
+    def __init__(self, max_k=30, leafsize=16, n_jobs=None):
+        if max_k < 1:
+            raise ValueError("max_k must be at least 1 (got {})".format(max_k))
+        self.max_k = max_k
+        self.leafsize = leafsize
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        self.classes_, self.codes_ = np.unique(np.asarray(y), return_inverse=True)
+        self.tree_ = cKDTree(X, leafsize=self.leafsize)
+        return self
+
+    def kneighbors(self, X):
+        """Indices of the min(max_k, n_train) nearest training points of each row of X, nearest first."""
+        k = min(self.max_k, self.tree_.n)
+        _, idx = self.tree_.query(np.asarray(X, dtype=np.float64), k=k, workers=self.n_jobs or -1)
+        return idx.reshape(-1, k)  # query drops the k axis when k == 1
+
+    def predict_all_codes(self, X):
+        """
+        Class index predicted for each row of X by every k, shape (n_samples, max_k). Columns for k larger than the
+        number of training points repeat the prediction using all of them
+        """
+        neighbor_codes = self.codes_[self.kneighbors(X)]
+        n = neighbor_codes.shape[0]
+        rows = np.arange(n)
+        votes = np.zeros((n, len(self.classes_)), dtype=np.int32)
+        preds = np.empty((n, self.max_k), dtype=np.int64)
+        for k in range(self.max_k):
+            if k < neighbor_codes.shape[1]:
+                votes[rows, neighbor_codes[:, k]] += 1  # each row gets exactly one vote, so no np.add.at needed
+                best = votes.argmax(axis=1)
+            preds[:, k] = best
+        return preds
+
+    def predict_all(self, X):
+        """Class label predicted for each row of X by every k, shape (n_samples, max_k)."""
+        return self.classes_[self.predict_all_codes(X)]
+
+    def predict(self, X, k=None):
+        """Class label predicted for each row of X using k neighbors (default max_k)."""
+        k = k or self.max_k
+        if not 1 <= k <= self.max_k:
+            raise ValueError("k must be between 1 and max_k={} (got {})".format(self.max_k, k))
+        return self.predict_all(X)[:, k - 1]
+
+
+def knn_grid_search(X, y, folds, ks=range(1, 31), scoring=accuracy, leafsize=16, n_jobs=None):
+    """
+    Cross validate a uniform-vote KNN classifier for every k in ks, with one tree and one query per fold
+
+    folds: fold id for each sample (see mlpb.cv.stratified_folds)
+    scoring: callable(y_true, y_pred) -> float where higher is better. Labels are passed as class indices
+    Returns a mlpb.cv.GridSearchResult with params [{'n_neighbors': k} for k in ks]
+    """
+    ks = list(ks)
+    if not ks or min(ks) < 1:
+        raise ValueError("ks must be a non-empty list of positive integers (got {})".format(ks))
+    X = np.asarray(X)
+    classes, y_codes = np.unique(np.asarray(y), return_inverse=True)
+    folds = np.asarray(folds)
+    fold_ids = np.unique(folds)
+    columns = np.array(ks) - 1
+
+    fold_scores = np.empty((len(ks), len(fold_ids)))
+    oof = np.empty((len(ks), len(y_codes)), dtype=classes.dtype)
+    for f, fold in enumerate(fold_ids):
+        test = folds == fold
+        model = MultiKNN(max_k=max(ks), leafsize=leafsize, n_jobs=n_jobs).fit(X[~test], y_codes[~test])
+
+        # The model's classes are the codes present in the training folds; map them back to the full set of codes
+        preds = model.predict_all(X[test])[:, columns]
+        for i in range(len(ks)):
+            fold_scores[i, f] = scoring(y_codes[test], preds[:, i])
+        oof[:, test] = classes[preds.T]
+
+    return GridSearchResult([{'n_neighbors': k} for k in ks], fold_scores, oof, classes)
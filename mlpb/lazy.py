@@ -0,0 +1,357 @@
+# Fast start for short script runs: lazy imports, display settings and a warm worker process
+
+# Notes about this module:
+# A short scoring run spends most of its time importing: pandas takes about half a second, scikit-learn and xgboost
+# about two seconds each, while scoring a few thousand leads takes milliseconds. This module has three remedies:
+# - lazy_import("scipy.sparse") returns a stand-in that imports the module the first time one of its attributes is used,
+#   so modules only pay for the libraries the called code path needs
+# - configure_display() sets the pandas display options the scripts use, but only in an interactive session (a REPL,
+#   IPython/Jupyter or python -i), so batch runs don't import pandas just to format output nobody sees
+# - a warm worker: `python mlpb/lazy.py serve` starts a long-lived process that imports everything once and keeps
+#   loaded models resident (see resident()). `python mlpb/lazy.py call module:function ...` (or call_worker()) sends it
+#   a function call over a Unix socket ($MLPB_WORKER_SOCKET, default ~/.cache/mlpb/worker.sock) and prints the result.
+#   The client only imports the standard library, so a call costs tens of milliseconds instead of seconds of imports
+#   and model loading.
+# The lazy imports only help modules that can skip a library: lead_features, lead_refresh and lead_service import
+# scipy.sparse lazily, so scoring with scikit-learn never loads it. The rank_leads_* scripts still import scikit-learn
+# or xgboost up front, since every run fits a model or loads a cached one (unpickling needs the library too); for
+# repeated short runs the saving comes from the warm worker, not from lazy imports.
+# The worker survives anything a call does short of a KeyboardInterrupt (including sys.exit() in the called function)
+# and a client that disconnects before its reply is sent.
+#
+# startup_time() (or `python mlpb/lazy.py startup`) measures the wall time of fresh interpreter runs, to compare cold
+# starts against warm calls.
+#
+# This module must only import the standard library at the top, since the client side runs in the cold process.
+#
+# Usage:
+#   sparse = lazy_import("scipy.sparse")
+#   configure_display(max_rows=10, max_columns=20, width=190)
+#   python mlpb/lazy.py serve --preload pandas sklearn.ensemble &
+#   cd "Problems/Rank Sales Leads"
+#   python ../../mlpb/lazy.py call lead_service:score_file scorer.pkl _Data/test.csv --kwargs '{"top_k": 10}'
+#   python ../../mlpb/lazy.py startup -c "import lead_service"  # cold start, for comparison
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import traceback
+
+DEFAULT_SOCKET = os.environ.get('MLPB_WORKER_SOCKET',
+                                os.path.join(os.path.expanduser('~'), '.cache', 'mlpb', 'worker.sock'))
+
+#======================================================================================================
+# Lazy imports
+
+
+class LazyModule(object):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<lazy module '{}' ({})>".format(self._name, state)
+
+
+def lazy_import(name):
+    """The module if it is already imported, else a LazyModule that imports it when first used."""
+    return sys.modules.get(name) or LazyModule(name)
+
+#======================================================================================================
+# Display settings
+
+
+def is_interactive():
+    """True in a REPL, IPython/Jupyter or python -i; False when a script runs in batch."""
+    if hasattr(sys, 'ps1') or sys.flags.interactive:
+        return True
+    ipython = sys.modules.get('IPython')
+    return ipython is not None and ipython.get_ipython() is not None
+
+
+def configure_display(force=False, **options):
+    """
+    Set pandas display options (e.g. max_rows=10 for display.max_rows) if the session is interactive or force is True
+
+    Returns True if the options were set.
+    """
+    if not (force or is_interactive()):
+        return False
+    import pandas as pd
+    for name, value in options.items():
+        pd.set_option('display.' + name, value)
+    return True
+
+#======================================================================================================
+# Warm worker
+
+# Objects kept alive between calls in the worker (key -> object)
+_resident = {}
+
+
+def resident(key, loader):
+    """
+    The object stored under key, created with loader() on first use
+
+    In the warm worker this keeps models loaded between calls; in a normal run it is a plain memo. Include something
+    like the file's mtime in key so edited files are reloaded.
+    """
+    if key not in _resident:
+        _resident[key] = loader()
+    return _resident[key]
+
+
+def _jsonable(obj):
+    # DataFrames become lists of records, arrays and numpy scalars plain Python values
+    if hasattr(obj, 'to_dict') and hasattr(obj, 'columns'):
+        return json.loads(obj.to_json(orient='records'))
+    if hasattr(obj, 'to_list'):
+        return obj.to_list()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError("Can't send a {} back to the client".format(type(obj).__name__))
+
+
+# Modules the worker has loaded from problem directories, keyed by their absolute file path. Problem directories can
+# have helper modules with the same name (nnet.py...), so a directory's modules are only in sys.modules, and the
+# directory on sys.path, while a call from that directory runs
+_loaded = {}
+
+
+def _in_directory(module, directory):
+    path = getattr(module, '__file__', None)
+    return path is not None and os.path.abspath(path).startswith(directory + os.sep)
+
+
+@contextlib.contextmanager
+def _directory_modules(directory):
+    # Make directory's modules importable by name for the duration of a call (for the target's own imports, and for
+    # unpickling objects whose classes are defined there), then put them, and any it newly imported, aside again
+    for path, module in _loaded.items():
+        if path.startswith(directory + os.sep):
+            sys.modules[module.__name__] = module
+    sys.path.insert(0, directory)
+    try:
+        yield
+    finally:
+        sys.path.remove(directory)
+        for name, module in list(sys.modules.items()):
+            if _in_directory(module, directory):
+                _loaded[os.path.abspath(module.__file__)] = sys.modules.pop(name)
+
+
+def _resolve(target, directory):
+    # "module:function", where module is a .py file in directory (e.g. a problem directory's helper module). Loaded
+    # modules are kept, so restart the worker after editing them
+    module_name, _, function = target.partition(':')
+    if not function:
+        raise ValueError("target must look like module:function (got {})".format(target))
+    path = os.path.join(directory, *module_name.split('.')) + '.py'
+    module = _loaded.get(path) or sys.modules.get(module_name)
+    if module is None or not _in_directory(module, directory):
+        if not os.path.exists(path):
+            raise ValueError("No module {} in {}".format(module_name, directory))
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+    return getattr(module, function)
+
+
+def _recv_json(conn):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data)
+
+
+def _send_json(conn, obj):
+    conn.sendall(json.dumps(obj, default=_jsonable).encode() + b'\n')
+
+
+def _handle(request):
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    if request.get('command') == 'stop':
+        return {'result': 'stopping'}, True
+    if request.get('command') == 'ping':
+        return {'result': {'pid': os.getpid(), 'resident': [str(k) for k in _resident]}}, False
+    start = time.perf_counter()
+    cwd = os.getcwd()
+    try:
+        directory = os.path.abspath(request['cwd'])
+        os.chdir(directory)
+        with _directory_modules(directory):
+            function = _resolve(request['target'], directory)
+            result = function(*request.get('args', []), **request.get('kwargs', {}))
+        return {'result': result, 'seconds': time.perf_counter() - start}, False
+    except KeyboardInterrupt:
+        raise
+    except BaseException:
+        # Including SystemExit, so a called script's sys.exit() doesn't stop the worker
+        return {'error': traceback.format_exc()}, False
+    finally:
+        os.chdir(cwd)
+
+
+def serve_worker(path=DEFAULT_SOCKET, preload=()):
+    """
+    Run the warm worker until it receives a stop command. Calls are handled one at a time
+
+    preload: modules to import before accepting calls (e.g. ['pandas', 'sklearn.ensemble', 'xgboost'])
+    """
+    for name in preload:
+        importlib.import_module(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    try:
+        stop = False
+        while not stop:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    try:
+                        response, stop = _handle(_recv_json(conn))
+                    except ValueError as e:
+                        response = {'error': 'bad request: {}'.format(e)}
+                    try:
+                        _send_json(conn, response)
+                    except TypeError as e:
+                        _send_json(conn, {'error': str(e)})
+                except OSError:
+                    pass  # the client went away (e.g. BrokenPipeError); carry on with the next call
+    finally:
+        server.close()
+        os.remove(path)
+
+
+def _request(path, request):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(path)
+        except OSError as e:
+            message = "No warm worker at {} ({}); start one with `python mlpb/lazy.py serve`".format(path, e)
+            raise RuntimeError(message) from None
+        _send_json(client, request)
+        try:
+            response = _recv_json(client)
+        except (ValueError, OSError):
+            response = None
+    if not isinstance(response, dict):
+        raise RuntimeError("No valid reply from the warm worker at {} (did it crash?)".format(path))
+    if 'error' in response:
+        raise RuntimeError("Call failed in the warm worker:\n" + response['error'])
+    return response['result']
+
+
+def call_worker(target, *args, path=DEFAULT_SOCKET, **kwargs):
+    """
+    Call module:function in the warm worker, with the current working directory, and return its (JSON) result
+
+    Arguments and the result must be JSON-serializable (DataFrames come back as lists of records).
+    """
+    return _request(path, {'target': target, 'args': list(args), 'kwargs': kwargs, 'cwd': os.getcwd()})
+
+
+def stop_worker(path=DEFAULT_SOCKET):
+    return _request(path, {'command': 'stop'})
+
+
+def ping_worker(path=DEFAULT_SOCKET):
+    """The worker's pid and resident keys."""
+    return _request(path, {'command': 'ping'})
+
+#======================================================================================================
+# Startup time
+
+
+def startup_time(code='pass', repeat=5):
+    """Median wall time (seconds) of `python -c code` in a fresh interpreter, run from the current directory."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import sys; sys.path.insert(0, ""); ' + code], check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm worker for fast repeated script calls")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="start the warm worker")
+    serve.add_argument('--preload', nargs='*', default=['numpy', 'pandas'])
+    call = commands.add_parser('call', help="call module:function in the worker and print the JSON result")
+    call.add_argument('target')
+    call.add_argument('args', nargs='*', help="positional arguments (parsed as JSON where possible)")
+    call.add_argument('--kwargs', default='{}', help="keyword arguments as a JSON object")
+    commands.add_parser('ping', help="show the worker's pid and resident objects")
+    commands.add_parser('stop', help="stop the worker")
+    startup = commands.add_parser('startup', help="median cold start time of a fresh interpreter")
+    startup.add_argument('-c', dest='code', default='pass')
+    startup.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve_worker(args.socket, preload=args.preload)
+    elif args.command == 'startup':
+        print("{:.3f} s".format(startup_time(args.code, args.repeat)))
+    else:
+        try:
+            _client_command(args)
+        except RuntimeError as e:
+            sys.exit(str(e))
+
+
+def _client_command(args):
+    if args.command == 'call':
+        def parse(value):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        result = call_worker(args.target, *[parse(a) for a in args.args], path=args.socket, **json.loads(args.kwargs))
+        print(json.dumps(result, indent=1))
+    elif args.command == 'ping':
+        print(json.dumps(ping_worker(args.socket)))
+    else:
+        stop_worker(args.socket)
+
+
+if __name__ == '__main__':
+    # Run through the package module, so the worker's resident objects are the ones mlpb.lazy.resident() fills
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from mlpb.lazy import main as package_main
+    package_main()
@@ -0,0 +1,125 @@
+# Evaluation metrics that can be computed chunk by chunk
+
+# Notes about this module:
+# roc_auc_score needs every label and score in memory and sorts them. StreamingAUC instead accumulates the scores of
+# positive and negative samples into two fixed-resolution histograms. Histograms from different chunks, workers or
+# processes are merged by adding them, so AUC can be measured on outputs too large to materialize, or per segment in
+# parallel.
+#
+# Pairs whose scores fall in the same bin are counted as ties (1/2), so the estimate is off by at most half the share of
+# (positive, negative) pairs that share a bin. error_bound() reports exactly that bound for the data seen so far.
+#
+# Usage:
+#   auc = StreamingAUC(bins=10000)
+#   for chunk in chunks:
+#       auc.update(y_true=chunk.Sale, y_score=chunk.ProbSale)
+#   auc.score(), auc.error_bound()
+#
+#   # combine results from several workers
+#   total = StreamingAUC.merged([auc1, auc2, auc3])
+#
+#   python -m mlpb.metrics  # check score() against sklearn's roc_auc_score, including scores outside [low, high]
+
+import numpy as np
+
+
+class StreamingAUC(object):
+    """
+    Mergeable, fixed-memory estimate of the area under the ROC curve
+
+    bins: number of equal-width score bins between low and high (more bins = smaller error bound)
+    low, high: range of the scores. Scores outside the range are counted in the first or last bin. NaN and infinite
+      scores are rejected
+    """
+
+    def __init__(self, bins=10000, low=0.0, high=1.0):
+        if bins < 1 or not high > low:
+            raise ValueError("Need bins >= 1 and high > low")
+        self.bins = bins
+        self.low = low
+        self.high = high
+        self.pos = np.zeros(bins, dtype=np.int64)
+        self.neg = np.zeros(bins, dtype=np.int64)
+
+    def update(self, y_true, y_score):
+        """Add a chunk of binary labels and scores."""
+        y_true = np.asarray(y_true).astype(bool)
+        y_score = np.asarray(y_score, dtype=np.float64)
+        if y_true.shape != y_score.shape:
+            raise ValueError("y_true and y_score must have the same shape")
+        finite = np.isfinite(y_score)
+        if not finite.all():
+            raise ValueError("y_score has {} NaN or infinite values".format(int((~finite).sum())))
+
+        # Clip before casting: positions beyond the int64 range (e.g. a score of 1e30) would wrap around
+        position = (y_score - self.low) * (self.bins / (self.high - self.low))
+        idx = np.clip(position, 0, self.bins - 1).astype(np.int64)
+        self.pos += np.bincount(idx[y_true], minlength=self.bins)
+        self.neg += np.bincount(idx[~y_true], minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        """Add the counts of another StreamingAUC with the same bins into this one."""
+        if (self.bins, self.low, self.high) != (other.bins, other.low, other.high):
+            raise ValueError("Can only merge StreamingAUCs with the same bins, low and high")
+        self.pos += other.pos
+        self.neg += other.neg
+        return self
+
+    @classmethod
+    def merged(cls, aucs):
+        """A new StreamingAUC holding the combined counts of several StreamingAUCs."""
+        aucs = list(aucs)
+        result = cls(bins=aucs[0].bins, low=aucs[0].low, high=aucs[0].high)
+        for auc in aucs:
+            result.merge(auc)
+        return result
+
+    @property
+    def n_pos(self):
+        return int(self.pos.sum())
+
+    @property
+    def n_neg(self):
+        return int(self.neg.sum())
+
+    def score(self):
+        """Estimated AUC (ties and same-bin pairs count 1/2)."""
+        pairs = self._pairs()
+        neg_below = np.cumsum(self.neg) - self.neg
+        wins = np.dot(self.pos.astype(np.float64), neg_below) + 0.5 * np.dot(self.pos.astype(np.float64), self.neg)
+        return wins / pairs
+
+    def error_bound(self):
+        """Largest possible difference between score() and the exact AUC of the scores seen so far."""
+        return 0.5 * np.dot(self.pos.astype(np.float64), self.neg) / self._pairs()
+
+    def _pairs(self):
+        pairs = float(self.n_pos) * self.n_neg
+        if pairs == 0:
+            raise ValueError("AUC is undefined unless both classes have been seen")
+        return pairs
+
+
+def check(n=100000, bins=10000, seed=2016):
+    """
+    Compare score() with roc_auc_score on random scores, a fifth of them outside [0, 1]. Raises an AssertionError if
+    the difference exceeds error_bound()
+    """
+    from sklearn.metrics import roc_auc_score
+    rng = np.random.RandomState(seed)
+    y_true = rng.rand(n) < 0.3
+    y_score = np.clip(rng.normal(0.4 + 0.2 * y_true, 0.25), -0.5, 1.5)
+    y_score[rng.rand(n) < 0.01] = 1e30
+    y_score[rng.rand(n) < 0.01] = -1e30
+    auc = StreamingAUC(bins=bins).update(y_true, y_score)
+    exact = roc_auc_score(y_true, y_score)
+    assert abs(auc.score() - exact) <= auc.error_bound(), (auc.score(), exact, auc.error_bound())
+
+    # A score far above high ranks above everything in range
+    assert StreamingAUC(bins=bins).update([False, True], [0.5, 1e30]).score() == 1.0
+    return auc.score(), exact, auc.error_bound()
+
+
+if __name__ == '__main__':
+    print("StreamingAUC {:.6f}, roc_auc_score {:.6f}, error bound {:.6f}".format(*check()))
@@ -0,0 +1,186 @@
+# Stage timing and memory profiling for the problem scripts
+
+# Notes about this module:
+# The scripts are notebooks divided into stages by #===== banners (Load Data, Feature engineering, Model, Predictions...).
+# A Profiler records, for each stage, its wall time, CPU time, peak Python memory allocated during the stage (tracemalloc),
+# peak resident set size and the number of rows it processed, and optionally a cProfile of the stage. Scripts call
+# profiler.mark("Stage name") at each banner, which ends the previous stage and starts the next, so no code has to be
+# re-indented. Peak RSS is measured per stage on Linux (the kernel's high-water mark is reset at each mark); elsewhere it
+# is the process-wide peak so far.
+#
+# Profiling is off (and marks cost almost nothing) unless the MLPB_PROFILE environment variable is set:
+#   MLPB_PROFILE=1         stages are timed and traced with tracemalloc, and the report is printed at the end
+#   MLPB_PROFILE=cprofile  same, plus a cProfile of every stage (the 10 most expensive functions are in the report)
+# finish() writes <script>.profile.json (the report) and <script>.trace.json (Chrome trace format: open it in
+# chrome://tracing or https://ui.perfetto.dev) to $MLPB_PROFILE_DIR, default the working directory.
+# tracemalloc slows down allocation-heavy code, so compare wall times between runs with the same MLPB_PROFILE setting.
+#
+# Usage:
+#   profiler = Profiler.from_env("rank_leads_rf1")
+#   profiler.mark("Load Data")
+#   train = pd.read_csv(...)
+#   profiler.mark("Model", rows=train.shape[0])
+#   ...
+#   profiler.finish()
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+MODES = ['off', 'on', 'cprofile']
+
+
+def reset_peak_rss():
+    """Reset the process's peak resident set size (Linux only). Returns True if it was reset."""
+    # Writing 5 to clear_refs resets VmHWM
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (since the last reset_peak_rss() on Linux, None on Windows)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+class Profiler(object):
+    """
+    Records the wall time, CPU time, peak allocation, peak RSS and rows of consecutive stages
+
+    name: name of the profiled script (used for the output file names)
+    enabled: if False, every method is a no-op
+    trace_memory: measure each stage's peak allocation with tracemalloc
+    cprofile: run cProfile over each stage
+    """
+
+    def __init__(self, name, enabled=True, trace_memory=True, cprofile=False, out_dir=None):
+        self.name = name
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile = cprofile
+        self.out_dir = out_dir or os.getcwd()
+        self.stages = []
+        self._current = None
+        self._t0 = time.perf_counter()
+
+    @classmethod
+    def from_env(cls, name):
+        """Profiler configured by $MLPB_PROFILE (unset, 0 or off: disabled; 1 or on: enabled; cprofile) and $MLPB_PROFILE_DIR."""
+        mode = os.environ.get('MLPB_PROFILE', 'off').lower()
+        mode = {'': 'off', '0': 'off', '1': 'on'}.get(mode, mode)
+        if mode not in MODES:
+            raise ValueError("MLPB_PROFILE must be one of {} (got {})".format(MODES, mode))
+        return cls(name, enabled=mode != 'off', cprofile=mode == 'cprofile', out_dir=os.environ.get('MLPB_PROFILE_DIR'))
+
+    #--------------------------------------------------
+    # Stages
+
+    def mark(self, stage, rows=None):
+        """End the current stage (if any) and start a new one. rows: number of rows the stage processes, if known."""
+        if not self.enabled:
+            return
+        self._end()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        reset_peak_rss()
+        self._current = {
+            'stage': stage,
+            'rows': rows,
+            'start_sec': time.perf_counter() - self._t0,
+            'alloc_start_mb': tracemalloc.get_traced_memory()[0] / 1024**2 if self.trace_memory else None,
+            '_wall': time.perf_counter(),
+            '_cpu': time.process_time()
+        }
+        if self.cprofile:
+            self._current['_profile'] = cProfile.Profile()
+            self._current['_profile'].enable()
+
+    def rows(self, n):
+        """Set the number of rows processed by the current stage (e.g. once a Load Data stage knows it)."""
+        if self.enabled and self._current is not None:
+            self._current['rows'] = n
+
+    def _end(self):
+        record = self._current
+        if record is None:
+            return
+        self._current = None
+        if '_profile' in record:
+            record['_profile'].disable()
+        record['wall_sec'] = time.perf_counter() - record.pop('_wall')
+        record['cpu_sec'] = time.process_time() - record.pop('_cpu')
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['alloc_end_mb'] = current / 1024**2
+            record['peak_alloc_mb'] = peak / 1024**2
+        record['peak_rss_mb'] = peak_rss_mb()
+        record['rows_per_sec'] = record['rows'] / record['wall_sec'] if record['rows'] and record['wall_sec'] > 0 else None
+        if '_profile' in record:
+            profile = record.pop('_profile')
+            stats = io.StringIO()
+            pstats.Stats(profile, stream=stats).sort_stats('cumulative').print_stats(10)
+            record['cprofile_top'] = stats.getvalue()
+            os.makedirs(self.out_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.out_dir, '{}.{}.prof'.format(self.name, len(self.stages))))
+        self.stages.append(record)
+
+    #--------------------------------------------------
+    # Output
+
+    def report(self):
+        """DataFrame with one row per finished stage."""
+        columns = ['stage', 'rows', 'wall_sec', 'cpu_sec', 'peak_alloc_mb', 'peak_rss_mb', 'rows_per_sec']
+        return pd.DataFrame([{c: s.get(c) for c in columns} for s in self.stages], columns=columns)
+
+    def chrome_trace(self):
+        """The stages as Chrome trace events (complete events, plus a counter of allocated memory)."""
+        pid = os.getpid()
+        events = []
+        for s in self.stages:
+            args = {k: v for k, v in s.items() if k not in ('stage', 'start_sec', 'cprofile_top')}
+            events.append({'name': s['stage'], 'cat': self.name, 'ph': 'X', 'pid': pid, 'tid': 0,
+                           'ts': s['start_sec'] * 1e6, 'dur': s['wall_sec'] * 1e6, 'args': args})
+            if s.get('alloc_start_mb') is not None:
+                events.append({'name': 'allocated MB', 'ph': 'C', 'pid': pid, 'ts': s['start_sec'] * 1e6,
+                               'args': {'MB': s['alloc_start_mb']}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def finish(self, verbose=True):
+        """End the last stage, write the json report and the Chrome trace, and print the report (if verbose)."""
+        if not self.enabled:
+            return None
+        self._end()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(os.path.join(self.out_dir, '{}.profile.json'.format(self.name)), 'w') as f:
+            json.dump({'name': self.name, 'stages': self.stages}, f, indent=1)
+        with open(os.path.join(self.out_dir, '{}.trace.json'.format(self.name)), 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        report = self.report()
+        if verbose:
+            print(report.to_string(float_format=lambda x: '{:,.3f}'.format(x)))
+        return report
@@ -0,0 +1,234 @@
+# Compact, declared dtypes for the _Data tables
+
+# Notes about this module:
+# read_csv types every text column as Python strings (PhoneNumber, CompanyName, Website...), which costs 50-100 bytes
+# per value, and gives no guarantee about the type of the other columns. A Schema declares the minimal dtype of every
+# column a problem's scripts use and enforces it on load:
+# - repeated text (TypeOfBusiness, Contact, Opponent...) becomes a Categorical, parsed straight from the file, so each
+#   distinct string is stored once and each row holds an int8/int16/int32 code. Text that is unique to almost every row
+#   (CompanyName, Website) stays str, where a Categorical would only add the codes
+# - booleans are numpy bools (1 byte), counts and ranks small ints, and measurements float32 (float64 where the table is
+#   small and exact values matter more than memory, as for Iris)
+# - derived columns replace the text they are parsed from: AreaCode is the int16 area code of PhoneNumber (-1 if
+#   missing), and PhoneNumber itself is not kept. Sources are always read as text, so a csv and its columnar copy give
+#   the same AreaCode
+# - columns a schema doesn't mention are not loaded, unless they are asked for as extra_columns (read as text and
+#   passed through unchanged, e.g. to keep PhoneNumber next to a ranking)
+# Integer and bool columns that have missing values, or values that don't fit the declared type, raise a ValueError
+# instead of being silently widened.
+#
+# Schema.read() uses the columnar copy of a table when there is one (see colstore.py); read_chunks() streams a csv.
+# memory_report() compares the in-memory size of a table read with read_csv and with its schema.
+#
+# Usage (from a problem directory, with the repository root on sys.path):
+#   train = LEADS.read("_Data/train.csv")
+#   test = LEADS.read("_Data/test.csv", columns=['LeadID', 'AreaCode', 'Contact', 'Sale'])
+#   for chunk in LEADS.read_chunks("_Data/test.csv", chunksize=100000, extra_columns=['PhoneNumber']): ...
+#   memory_report("_Data/train.csv", LEADS)
+
+import re
+import numpy as np
+import pandas as pd
+from mlpb.colstore import read_table
+
+# Code of a missing or unparseable value in derived integer columns
+NA_CODE = -1
+
+# Area code of a phone number: its first three characters, if they are digits. Numbers are written as integers first
+AREA_CODE_PATTERN = r'^([0-9]{3})'
+_area_code = re.compile(AREA_CODE_PATTERN)
+
+#======================================================================================================
+# Derived columns
+
+
+def area_code(phone):
+    """Area code of one phone number (a string or a number) as an int, the same as area_code_from_phone gives it."""
+    if phone is None:
+        return NA_CODE
+    if isinstance(phone, (int, float, np.number)) and not isinstance(phone, (bool, np.bool_)):
+        phone = '%.0f' % float(phone)  # NaN and inf become 'nan' and 'inf', which don't match
+    match = _area_code.match(str(phone))
+    return int(match.group(1)) if match else NA_CODE
+
+
+def area_code_from_phone(phone):
+    """
+    Area code (first three characters, if they are digits) of each phone number as int16, NA_CODE where missing or not
+    digits
+
+    Numbers are written as integers and parsed as text, the same way as strings (and as area_code() parses one).
+    """
+    if isinstance(phone.dtype, pd.CategoricalDtype):
+        # Parse each distinct phone number once, then look the codes up (code -1, missing, picks the trailing NA_CODE)
+        parsed = area_code_from_phone(pd.Series(phone.cat.categories)).to_numpy()
+        values = np.append(parsed, np.int16(NA_CODE))[phone.cat.codes.to_numpy()]
+        return pd.Series(values, index=phone.index, name='AreaCode')
+    if phone.dtype == object:
+        # Mixed values (e.g. a frame built from lead dicts): parse each one by itself
+        return pd.Series(np.array([area_code(v) for v in phone], dtype=np.int16), index=phone.index, name='AreaCode')
+    if pd.api.types.is_numeric_dtype(phone):
+        # e.g. phone numbers that read_csv parsed as int64, or float64 if some are missing
+        phone = pd.Series(np.char.mod('%.0f', phone.to_numpy(dtype=np.float64)), index=phone.index)
+    codes = pd.to_numeric(phone.astype('str').str.extract(AREA_CODE_PATTERN, expand=False))
+    return pd.Series(codes.fillna(NA_CODE).to_numpy(dtype=np.int16), index=phone.index, name='AreaCode')
+
+#======================================================================================================
+# Schemas
+
+
+class Schema(object):
+    """
+    Declared dtypes of a table's columns, enforced on load
+
+    dtypes: {column: dtype} in output order. dtype is 'category', 'str', 'bool' or a numpy dtype name ('int16',
+      'float32'...)
+    derived: {column: (source column, function)} columns computed by function(source Series). Sources are read as text
+      (unless they are also in dtypes) and dropped afterwards
+    """
+
+    def __init__(self, dtypes, derived=None):
+        self.dtypes = dict(dtypes)
+        self.derived = dict(derived or {})
+        for col, dtype in self.dtypes.items():
+            if dtype not in ('category', 'str', 'bool'):
+                np.dtype(dtype)  # raises TypeError for unknown dtypes
+
+    @property
+    def columns(self):
+        return list(self.dtypes) + list(self.derived)
+
+    def _selected(self, columns):
+        if columns is None:
+            return self.columns
+        unknown = [c for c in columns if c not in self.columns]
+        if unknown:
+            raise ValueError("Columns not in the schema: {}".format(unknown))
+        return list(columns)
+
+    def source_columns(self, columns=None):
+        """Columns to read from the file to produce `columns` (default all of the schema's columns)."""
+        sources = []
+        for col in self._selected(columns):
+            source = self.derived[col][0] if col in self.derived else col
+            if source not in sources:
+                sources.append(source)
+        return sources
+
+    def _extra(self, extra_columns):
+        declared = [c for c in extra_columns if c in self.columns]
+        if declared:
+            raise ValueError("Columns in the schema can't be extra columns: {}".format(declared))
+        return list(extra_columns)
+
+    def _usecols(self, csv_path, columns, extra_columns):
+        # Source columns present in the file, plus the extra columns (which must be)
+        header = pd.read_csv(csv_path, nrows=0).columns
+        missing = [c for c in extra_columns if c not in header]
+        if missing:
+            raise ValueError("Columns not in {}: {}".format(csv_path, missing))
+        sources = [c for c in self.source_columns(columns) if c in header]
+        return sources + [c for c in extra_columns if c not in sources]
+
+    def csv_dtypes(self, extra_columns=()):
+        """
+        dtype argument for read_csv: text and floats are parsed directly, ints and bools checked in apply(). Sources of
+        derived columns and extra columns are read as text
+        """
+        dtypes = {col: dtype for col, dtype in self.dtypes.items()
+                  if dtype in ('category', 'str') or (dtype != 'bool' and np.dtype(dtype).kind == 'f')}
+        for source, _ in self.derived.values():
+            if source not in self.dtypes:
+                dtypes[source] = 'str'
+        for col in extra_columns:
+            dtypes[col] = 'str'
+        return dtypes
+
+    def _cast(self, values, dtype):
+        if dtype in ('category', 'str'):
+            return values.astype(dtype)
+        if dtype != 'bool' and np.dtype(dtype).kind == 'f':
+            return values.astype(dtype)
+        if values.isnull().any():
+            raise ValueError("Column {} has missing values, which {} can't hold".format(values.name, dtype))
+        if dtype == 'bool':
+            if not pd.api.types.is_bool_dtype(values):
+                raise ValueError("Column {} is {}, not bool".format(values.name, values.dtype))
+            return values.astype(bool)
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError("Column {} has values in [{}, {}], outside the range of {}".format(
+                values.name, values.min(), values.max(), dtype))
+        return values.astype(dtype)
+
+    def apply(self, data, columns=None, extra_columns=()):
+        """
+        DataFrame with the schema's columns (or `columns`) of data, derived and cast to their declared dtypes, followed
+        by extra_columns (columns not in the schema) as they are in data
+        """
+        out = {}
+        for col in self._selected(columns):
+            if col in self.derived:
+                source, function = self.derived[col]
+                out[col] = function(data[source])
+            elif col in data:
+                out[col] = self._cast(data[col], self.dtypes[col])
+        for col in self._extra(extra_columns):
+            out[col] = data[col]
+        return pd.DataFrame(out, index=data.index)
+
+    def read(self, csv_path, columns=None, extra_columns=()):
+        """
+        Read a table (from its columnar copy if it has an up to date one) with only the columns it needs
+
+        columns: the schema columns to return (default all of them). Columns missing from the file (e.g. the target in
+          a test set) are left out
+        extra_columns: columns not in the schema to return as text after them (a ValueError if the file doesn't have
+          them)
+        """
+        extra_columns = self._extra(extra_columns)
+        usecols = self._usecols(csv_path, columns, extra_columns)
+        data = read_table(csv_path, usecols=usecols, dtype=self.csv_dtypes(extra_columns), categorical=True)
+        return self.apply(data, columns, extra_columns)
+
+    def read_chunks(self, csv_path, chunksize, columns=None, extra_columns=()):
+        """Iterate over a csv in DataFrame chunks that follow the schema (columns, extra_columns: as for read())."""
+        extra_columns = self._extra(extra_columns)
+        usecols = self._usecols(csv_path, columns, extra_columns)
+        dtypes = self.csv_dtypes(extra_columns)
+        for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+            yield self.apply(chunk, columns, extra_columns)
+
+
+def memory_report(csv_path, schema):
+    """Bytes per column of a table read with plain read_csv and with its schema."""
+    plain = pd.read_csv(csv_path).memory_usage(deep=True, index=False)
+    typed = schema.read(csv_path).memory_usage(deep=True, index=False)
+    report = pd.DataFrame({'read_csv': plain, 'schema': typed})
+    report.loc['Total'] = report.sum()
+    return report
+
+#======================================================================================================
+# Problem schemas
+
+# Rank Sales Leads (train.csv, test.csv, leads.csv)
+LEADS = Schema(
+    dtypes={'LeadID': 'int32', 'CompanyName': 'str', 'TypeOfBusiness': 'category', 'FacebookLikes': 'float32',
+            'TwitterFollowers': 'float32', 'Website': 'str', 'Contact': 'category', 'Sale': 'bool'},
+    derived={'AreaCode': ('PhoneNumber', area_code_from_phone)}
+)
+
+# Predict NFL Game Winner (train.csv, test.csv)
+NFL = Schema(
+    dtypes={'Opponent': 'category', 'OppRk': 'int16', 'SaintsAtHome': 'bool', 'Expert1PredWin': 'bool',
+            'Expert2PredWin': 'bool', 'SaintsWon': 'bool'}
+)
+
+# Classify Iris Species (iris.csv, train.csv, test.csv). The measurements stay float64: the table is tiny, and float32
+# would turn values like 5.1 into 5.099999904632568 before the models see them
+IRIS = Schema(
+    dtypes={'Sepal.Length': 'float64', 'Sepal.Width': 'float64', 'Petal.Length': 'float64', 'Petal.Width': 'float64',
+            'Species': 'category'}
+)
+
+SCHEMAS = {'leads': LEADS, 'nfl': NFL, 'iris': IRIS}